@@ -0,0 +1,82 @@
+# ====================================================
+# Harness
+# Loads the package outside the editor, against the
+# stub sublime and sublime_plugin modules in stubs/.
+# The package is imported as "subl_utils" so its
+# relative imports resolve as they do in the editor.
+# ====================================================
+import importlib
+import os
+import sys
+import time
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+PACKAGE = 'subl_utils'
+
+# The package has its own select.py; the repo
+# directory must not shadow the standard module.
+sys.path = [p for p in sys.path if os.path.abspath(p or '.') not in (ROOT, BENCH_DIR)]
+sys.path.insert(0, os.path.join(BENCH_DIR, 'stubs'))
+
+import sublime
+import sublime_plugin
+
+
+def Setup(packages=None, cache=None):
+    sublime.set_paths(packages, cache)
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [ROOT]
+        sys.modules[PACKAGE] = package
+
+
+# ----------------------------------------
+# Import a plugin module and run its
+# plugin_loaded, as the editor does.
+# ----------------------------------------
+def Load(name):
+    module = importlib.import_module(PACKAGE + '.' + name)
+    if hasattr(module, 'plugin_loaded'):
+        module.plugin_loaded()
+    return module
+
+def Unload(name):
+    module = sys.modules.get(PACKAGE + '.' + name)
+    if module is not None and hasattr(module, 'plugin_unloaded'):
+        module.plugin_unloaded()
+
+
+# ----------------------------------------
+# Run queued set_timeout callbacks.
+# ----------------------------------------
+def Drain():
+    return sublime.drain()
+
+# Wait for the window's background file
+# job, then run what it queued.
+def WaitForFileJob(window, timeout=3600.0):
+    file = sys.modules[PACKAGE + '.file']
+    deadline = time.time() + timeout
+    while file.FileJob.get(window) is not None:
+        if time.time() > deadline:
+            raise RuntimeError("file job still running after {0} s".format(timeout))
+        time.sleep(0.01)
+    Drain()
+
+
+def NewWindow():
+    return sublime.Window()
+
+def NewView(window, text='', fileName=None, syntax=None):
+    view = sublime.View(text, fileName, syntax, window)
+    window.focus_view(view)
+    return view
+
+# Pick an item in the last quick panel.
+def SelectQuickPanelItem(window, index):
+    items, onSelect, onHighlight = window.quickPanels[-1]
+    onSelect(index)
+    Drain()
+    return items
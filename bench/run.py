@@ -0,0 +1,384 @@
+# ====================================================
+# Benchmarks
+# Each benchmark runs in its own process so its peak
+# RSS is its own. Usage:
+#   python bench/run.py [name ...] [--split-mb 2048]
+#       [--markdown-mb 50] [--csv-mb 1024] [--projects 10000]
+#       [--cursors 10000] [--fold-lines 100000]
+#       [--index-files 500000] [--output bench_output.txt]
+# ====================================================
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import harness
+
+RESULT_PREFIX = 'BENCH_RESULT '
+MB = 1024 * 1024
+
+
+# ----------------------------------------
+# Helpers
+# ----------------------------------------
+def PeakRssMb():
+    # ru_maxrss is in KB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def Measure(function, repeat=1):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            function()
+    return time.perf_counter() - start
+
+def Check(condition, msg):
+    if not condition:
+        raise AssertionError(msg)
+
+def Result(name, seconds, count, unit, baseRss):
+    return {
+        'name': name,
+        'seconds': seconds,
+        'throughput': count / seconds if seconds > 0 else float('inf'),
+        'unit': unit,
+        'baseRss': baseRss,
+        }
+
+def WriteFile(path, sizeMb, line):
+    block = line * max(1, (MB // len(line)))
+    written = 0
+    with open(path, 'w', newline='') as file:
+        while written < sizeMb * MB:
+            file.write(block)
+            written += len(block)
+    return os.path.getsize(path)
+
+
+# ----------------------------------------
+# GetProjects over synthetic projects,
+# cold (empty cache) then warm.
+# ----------------------------------------
+def BenchProjects(args, temp):
+    harness.Setup(os.path.join(temp, 'packages'), os.path.join(temp, 'cache'))
+    projects = harness.Load('projects')
+    dir = os.path.join(temp, 'packages', 'User', 'projects')
+    os.makedirs(dir)
+    for i in range(args.projects):
+        data = {'folders': [{'path': '/src/project{0}'.format(i)}, {'path': '/src/shared'}]}
+        with open(os.path.join(dir, 'project{0:05}.sublime-project'.format(i)), 'w') as file:
+            json.dump(data, file)
+
+    baseRss = PeakRssMb()
+    manager = projects.ProjectManager(harness.NewWindow())
+    results = []
+    runs = [
+        ('GetProjects cold', lambda: manager.GetProjects(), 1),
+        ('GetProjects cold parallel', lambda: manager.GetProjects(parallel=True), 1),
+        ('GetProjects warm', lambda: manager.GetProjects(), 10),
+        ]
+    for name, function, repeat in runs:
+        if 'cold' in name:
+            projects.ProjectCache.Invalidate()
+        seconds = Measure(function, repeat)
+        Check(len(manager.projects) == args.projects, "{0} listed {1} projects".format(name, len(manager.projects)))
+        results.append(Result(name, seconds, args.projects * repeat, 'projects/s', baseRss))
+    harness.Unload('projects')
+    harness.Unload('watcher')
+    return results
+
+
+# ----------------------------------------
+# SplitFileCommand on a large file, by
+# lines then by size.
+# ----------------------------------------
+def BenchSplit(args, temp):
+    harness.Setup(os.path.join(temp, 'packages'), os.path.join(temp, 'cache'))
+    file = harness.Load('file')
+    source = os.path.join(temp, 'big.txt')
+    size = WriteFile(source, args.split_mb, 'x' * 99 + '\n')
+
+    baseRss = PeakRssMb()
+    window = harness.NewWindow()
+    harness.NewView(window, fileName=source)
+    results = []
+    options = [
+        ('SplitFileCommand lines', str(max(1, size // 100 // 8))),
+        ('SplitFileCommand size', '{0}MB'.format(max(1, args.split_mb // 8))),
+        ]
+    for name, option in options:
+        def split():
+            file.SplitFileCommand(window).run(option)
+            harness.WaitForFileJob(window)
+        results.append(Result(name, Measure(split), size / MB, 'MB/s', baseRss))
+        parts = [os.path.join(temp, part) for part in os.listdir(temp) if '_part' in part]
+        Check(sum(os.path.getsize(part) for part in parts) == size, "{0} parts do not add up".format(name))
+        for part in parts:
+            os.remove(part)
+    return results
+
+
+# ----------------------------------------
+# Markdown title on a large unsaved buffer.
+# ----------------------------------------
+def BenchSetTitle(args, temp):
+    harness.Setup(os.path.join(temp, 'packages'), os.path.join(temp, 'cache'))
+    setTitle = harness.Load('setTitle')
+    paragraph = 'Some text with a [link](http://example.com) and `code`.\n' * 8 + '\n'
+    text = '# Benchmark title\n\n' + paragraph * (args.markdown_mb * MB // len(paragraph))
+
+    window = harness.NewWindow()
+    view = harness.NewView(window, text, syntax='Packages/Markdown/Markdown.sublime-syntax')
+    baseRss = PeakRssMb()
+    listener = setTitle.SetTitleOnMarkdownViewEvent()
+    repeat = 20
+
+    # Only the listener is timed: the stub
+    # buffer copies itself on every edit.
+    seconds = 0.0
+    for i in range(repeat):
+        view.replace_text(len(view.text), len(view.text), 'x')
+        seconds += Measure(lambda: (listener.on_modified_async(view), harness.Drain()))
+    return [Result('SetTitleOnMarkdownViewEvent', seconds, repeat, 'edits/s', baseRss)]
+
+
+# ----------------------------------------
+# Fuzzy file search over a large project:
+# a common query, a rarer one, and a near
+# miss that matches nothing.
+# ----------------------------------------
+def BenchFindFile(args, temp):
+    harness.Setup(os.path.join(temp, 'packages'), os.path.join(temp, 'cache'))
+    fileIndex = harness.Load('fileIndex')
+    words = ['src', 'utils', 'main', 'controller', 'service', 'index', 'lib', 'test',
+        'app', 'models', 'views', 'core', 'api', 'handlers', 'components', 'assets']
+    files = []
+    for i in range(args.index_files):
+        parts = [words[(i * 7 + k * 5) % len(words)] + str((i + k) % 50) for k in range(2 + i % 5)]
+        rel = '/'.join(parts) + ('.py', '.js', '.ts', '.md')[i % 4]
+        files.append((rel, '/project/' + rel))
+    index = fileIndex.FileIndex('bench')
+    index.dirs = {}
+    index.files = files
+    index.lowers = [rel.lower() for rel, path in files]
+    baseRss = PeakRssMb()
+    results = []
+    for query in ('index', 'srcutilsmain', 'controllerservicez'):
+        found = []
+        seconds = Measure(lambda: found.append(index.Search(query)))
+        results.append(Result('Search ' + query, seconds, 1, 'searches/s', baseRss))
+    Check(found and not found[-1], "near miss found {0} files".format(len(found[-1])))
+    return results
+
+
+# ----------------------------------------
+# Markdown outline on a 100k-line document:
+# edits applied incrementally, then the
+# "Go to heading" panel.
+# ----------------------------------------
+def BenchOutline(args, temp):
+    harness.Setup(os.path.join(temp, 'packages'), os.path.join(temp, 'cache'))
+    outline = harness.Load('markdownOutline')
+    section = '## Section {0}\n\ntext\n\nSetext {0}\n---\n' + 'More text in the section.\n' * 14
+    text = '# Runbook\n' + ''.join(section.format(i) for i in range(5000))
+
+    window = harness.NewWindow()
+    view = harness.NewView(window, text, syntax='Packages/Markdown/Markdown.sublime-syntax')
+    baseRss = PeakRssMb()
+    results = []
+    results.append(Result('Outline build', Measure(lambda: outline.Outline.Get(view)), 1, 'builds/s', baseRss))
+
+    headings = outline.Outline.Get(view)
+    repeat = 1000
+    seconds = 0.0
+    for i in range(repeat):
+        point = (i * 7919) % view.size()
+        view.replace_text(point, point, '#')
+        seconds += Measure(lambda: headings.Update(view, [(point, point, 1)]))
+    results.append(Result('Outline update', seconds, repeat, 'edits/s', baseRss))
+
+    command = outline.MarkdownGotoHeadingCommand(view)
+    results.append(Result('MarkdownGotoHeadingCommand', Measure(lambda: command.run(None)), 1, 'opens/s', baseRss))
+    return results
+
+
+# ----------------------------------------
+# Status bar path shortening.
+# ----------------------------------------
+def BenchShortenPath(args, temp):
+    harness.Setup(os.path.join(temp, 'packages'), os.path.join(temp, 'cache'))
+    paths = harness.Load('paths')
+    files = ['/home/user/src/project{0}/module{1}/sub/dir/file{2}.py'.format(i % 50, i % 7, i) for i in range(1000)]
+    baseRss = PeakRssMb()
+    repeat = 100
+
+    def shorten():
+        for path in files:
+            paths.shortenPath(path, 3)
+    seconds = Measure(shorten, repeat)
+    results = [Result('shortenPath', seconds, len(files) * repeat, 'paths/s', baseRss)]
+
+    # Focus changes across many open views.
+    statusBarPath = harness.Load('statusBarPath')
+    window = harness.NewWindow()
+    views = [harness.NewView(window, fileName=path) for path in files[:200]]
+    listener = statusBarPath.CurrentPathStatusCommand()
+
+    def activate():
+        for view in views:
+            listener.on_activated(view)
+            harness.Drain()
+    seconds = Measure(activate, 10)
+    results.append(Result('CurrentPathStatusCommand', seconds, len(views) * 10, 'activations/s', baseRss))
+    return results
+
+
+# ----------------------------------------
+# Wrap at the widest of many cursors.
+# ----------------------------------------
+def BenchWrapAtCursor(args, temp):
+    harness.Setup(os.path.join(temp, 'packages'), os.path.join(temp, 'cache'))
+    wrap = harness.Load('wrap')
+    lines = ['\t' * (i % 4) + 'word ' * (i % 30) for i in range(args.cursors)]
+    window = harness.NewWindow()
+    view = harness.NewView(window, '\n'.join(lines))
+    view.sel().add_all([harness.sublime.Region(view.line(point).end()) for point in view.LineStarts()])
+    baseRss = PeakRssMb()
+    command = wrap.SetWrapAtCursor(view)
+    repeat = 10
+    seconds = Measure(lambda: command.run(None), repeat)
+    return [Result('setWrapAtCursor', seconds, len(view.sel()) * repeat, 'cursors/s', baseRss)]
+
+
+# ----------------------------------------
+# Wrap width from the line-length
+# distribution of a large CSV buffer.
+# ----------------------------------------
+def BenchWrapFit(args, temp):
+    harness.Setup(os.path.join(temp, 'packages'), os.path.join(temp, 'cache'))
+    wrap = harness.Load('wrap')
+    row = ','.join('field{0}'.format(i) for i in range(12)) + '\n'
+    window = harness.NewWindow()
+    view = harness.NewView(window, row * (args.csv_mb * MB // len(row)))
+    baseRss = PeakRssMb()
+    command = wrap.SetWrapFitContent(view)
+    repeat = 10
+    seconds = Measure(lambda: command.run(None), repeat)
+    Check(view.settings().get('wrap_width') == len(row) - 1, "wrap width {0}".format(view.settings().get('wrap_width')))
+    return [Result('SetWrapFitContent', seconds, repeat, 'runs/s', baseRss)]
+
+
+# ----------------------------------------
+# Select around the folds of a long file,
+# overlapping and adjacent folds included.
+# ----------------------------------------
+def BenchSelectFolded(args, temp):
+    harness.Setup(os.path.join(temp, 'packages'), os.path.join(temp, 'cache'))
+    select = harness.Load('select')
+    Region = harness.sublime.Region
+    window = harness.NewWindow()
+    view = harness.NewView(window, '\n'.join('line {0} {{'.format(i) for i in range(args.fold_lines)))
+    starts = view.LineStarts()
+    view.fold([Region(starts[i] - 1, starts[i + 3] - 1) for i in range(1, len(starts) - 4, 5)]
+        + [Region(starts[i], starts[i + 1]) for i in range(2, len(starts) - 4, 5)])
+    baseRss = PeakRssMb()
+    command = select.SelectAllExceptFoldedCommand(view)
+    repeat = 10
+    seconds = Measure(lambda: command.run(None), repeat)
+    Check(len(view.sel()) == len(starts) // 5, "{0} unfolded regions".format(len(view.sel())))
+    return [Result('SelectAllExceptFolded', seconds, len(view.folded_regions()) * repeat, 'folds/s', baseRss)]
+
+
+BENCHMARKS = {
+    'projects': BenchProjects,
+    'findFile': BenchFindFile,
+    'split': BenchSplit,
+    'setTitle': BenchSetTitle,
+    'outline': BenchOutline,
+    'shortenPath': BenchShortenPath,
+    'wrapAtCursor': BenchWrapAtCursor,
+    'wrapFit': BenchWrapFit,
+    'selectFolded': BenchSelectFolded,
+    }
+
+
+# ----------------------------------------
+# Child: run one benchmark, print results.
+# ----------------------------------------
+def RunChild(args):
+    temp = tempfile.mkdtemp(prefix='subl-utils-bench-')
+    try:
+        results = BENCHMARKS[args.child](args, temp)
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
+    peakRss = PeakRssMb()
+    for result in results:
+        result['peakRss'] = peakRss
+        print(RESULT_PREFIX + json.dumps(result))
+
+def RunParent(args, argv):
+    names = args.names or list(BENCHMARKS)
+    header = "{0:<32} {1:>10} {2:>14} {3:<12} {4:>10} {5:>10}".format(
+        "Benchmark", "Seconds", "Throughput", "", "Base MB", "Peak MB")
+    lines = [header, "-" * len(header)]
+    print(header)
+    print(lines[1])
+    failed = False
+    for name in names:
+        if name not in BENCHMARKS:
+            print("Unknown benchmark: " + name)
+            failed = True
+            continue
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', name] + argv,
+            stdout=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0:
+            print("{0:<32} failed with code {1}".format(name, process.returncode))
+            failed = True
+            continue
+        for line in process.stdout.splitlines():
+            if not line.startswith(RESULT_PREFIX):
+                continue
+            result = json.loads(line[len(RESULT_PREFIX):])
+            line = "{0:<32} {1:>10.3f} {2:>14,.1f} {3:<12} {4:>10.1f} {5:>10.1f}".format(
+                result['name'], result['seconds'], result['throughput'], result['unit'],
+                result['baseRss'], result['peakRss'])
+            print(line)
+            lines.append(line)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+    return 1 if failed else 0
+
+def ParseArgs(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the package outside the editor.")
+    parser.add_argument('names', nargs='*', help="benchmarks to run: " + ', '.join(BENCHMARKS))
+    parser.add_argument('--split-mb', type=int, default=2048, help="size of the file to split")
+    parser.add_argument('--markdown-mb', type=int, default=50, help="size of the Markdown buffer")
+    parser.add_argument('--csv-mb', type=int, default=1024, help="size of the CSV buffer")
+    parser.add_argument('--projects', type=int, default=10000, help="number of synthetic projects")
+    parser.add_argument('--cursors', type=int, default=10000, help="number of cursors")
+    parser.add_argument('--fold-lines', type=int, default=100000, help="lines of the folded buffer")
+    parser.add_argument('--index-files', type=int, default=500000, help="number of paths in the file index")
+    parser.add_argument('--output', help="also write the table to this file")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = ParseArgs(sys.argv[1:])
+    if args.child:
+        RunChild(args)
+        sys.exit(0)
+    # Children get the sizing options, not the names.
+    childArgv = ['--split-mb', str(args.split_mb), '--markdown-mb', str(args.markdown_mb), '--csv-mb', str(args.csv_mb),
+        '--projects', str(args.projects), '--cursors', str(args.cursors), '--fold-lines', str(args.fold_lines),
+        '--index-files', str(args.index_files)]
+    sys.exit(RunParent(args, childArgv))
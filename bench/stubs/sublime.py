@@ -0,0 +1,491 @@
+# ====================================================
+# Headless stand-in for Sublime Text's sublime module.
+# Emulates what the package uses: regions, settings,
+# views over an in-memory buffer, windows with project
+# data and panels, and the timeout queues.
+# ====================================================
+import bisect
+import os
+import tempfile
+
+MONOSPACE_FONT = 1
+KEEP_OPEN_ON_FOCUS_LOST = 2
+WANT_EVENT = 4
+
+_pending = []
+_statusMessages = []
+_settings = {}
+_windows = []
+_ids = [0]
+_paths = {'packages': None, 'cache': None}
+
+
+def _nextId():
+    _ids[0] += 1
+    return _ids[0]
+
+
+# ----------------------------------------
+# Timeouts run when the harness drains the
+# queue, on the calling thread.
+# ----------------------------------------
+def set_timeout(callback, delay=0):
+    _pending.append(callback)
+
+def set_timeout_async(callback, delay=0):
+    _pending.append(callback)
+
+def drain():
+    count = 0
+    while _pending:
+        _pending.pop(0)()
+        count += 1
+    return count
+
+
+def status_message(msg):
+    _statusMessages.append(msg)
+
+def packages_path():
+    if _paths['packages'] is None:
+        _paths['packages'] = tempfile.mkdtemp(prefix='subl-stub-packages-')
+    return _paths['packages']
+
+def cache_path():
+    if _paths['cache'] is None:
+        _paths['cache'] = tempfile.mkdtemp(prefix='subl-stub-cache-')
+    return _paths['cache']
+
+def set_paths(packages=None, cache=None):
+    _paths['packages'] = packages
+    _paths['cache'] = cache
+
+def load_settings(name):
+    if name not in _settings:
+        _settings[name] = Settings()
+    return _settings[name]
+
+def save_settings(name):
+    pass
+
+def expand_variables(value, variables):
+    for key, replacement in variables.items():
+        value = value.replace('${' + key + '}', replacement).replace('$' + key, replacement)
+    return value
+
+def windows():
+    return list(_windows)
+
+def active_window():
+    if not _windows:
+        Window()
+    return _windows[-1]
+
+def run_command(name, args=None):
+    if name == 'new_window':
+        Window()
+
+
+# ====================================================
+# Region
+# ====================================================
+class Region:
+    __slots__ = ('a', 'b', 'xpos')
+
+    def __init__(self, a, b=None, xpos=-1):
+        self.a = a
+        self.b = a if b is None else b
+        self.xpos = xpos
+
+    def __repr__(self):
+        return "Region({0}, {1})".format(self.a, self.b)
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and self.a == other.a and self.b == other.b
+
+    def __hash__(self):
+        return hash((self.a, self.b))
+
+    def __lt__(self, other):
+        return (self.begin(), self.end()) < (other.begin(), other.end())
+
+    def __len__(self):
+        return self.size()
+
+    def __contains__(self, point):
+        if isinstance(point, Region):
+            return self.begin() <= point.begin() and point.end() <= self.end()
+        return self.begin() <= point <= self.end()
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.b - self.a)
+
+    def empty(self):
+        return self.a == self.b
+
+    def cover(self, other):
+        return Region(min(self.begin(), other.begin()), max(self.end(), other.end()))
+
+    def intersects(self, other):
+        return self.begin() < other.end() and other.begin() < self.end()
+
+    def intersection(self, other):
+        if not self.intersects(other):
+            return Region(0, 0)
+        return Region(max(self.begin(), other.begin()), min(self.end(), other.end()))
+
+    def contains(self, point):
+        return point in self
+
+
+# ====================================================
+# Settings
+# ====================================================
+class Settings:
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.callbacks = {}
+        self.writes = 0
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def has(self, key):
+        return key in self.values
+
+    def set(self, key, value):
+        self.values[key] = value
+        self.writes += 1
+        self.Notify()
+
+    def erase(self, key):
+        self.values.pop(key, None)
+        self.writes += 1
+        self.Notify()
+
+    def update(self, pairs=None, **kwargs):
+        self.values.update(pairs or {}, **kwargs)
+        self.writes += 1
+        self.Notify()
+
+    def to_dict(self):
+        return dict(self.values)
+
+    def add_on_change(self, tag, callback):
+        self.callbacks[tag] = callback
+
+    def clear_on_change(self, tag):
+        self.callbacks.pop(tag, None)
+
+    def Notify(self):
+        for callback in list(self.callbacks.values()):
+            callback()
+
+
+# ====================================================
+# Selection
+# ====================================================
+class Selection:
+    def __init__(self):
+        self.regions = []
+
+    def __iter__(self):
+        return iter(list(self.regions))
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __getitem__(self, index):
+        return self.regions[index]
+
+    def clear(self):
+        self.regions = []
+
+    def add(self, region):
+        if not isinstance(region, Region):
+            region = Region(region)
+        self.add_all([region])
+
+    def add_all(self, regions):
+        merged = sorted(self.regions + [r if isinstance(r, Region) else Region(r) for r in regions])
+        result = []
+        for region in merged:
+            last = result[-1] if result else None
+            # Overlapping, touching non-empty or identical regions merge.
+            if last is not None and (region.begin() < last.end()
+                    or (region.begin() == last.end() and not region.empty() and not last.empty())
+                    or region == last):
+                result[-1] = Region(last.begin(), max(last.end(), region.end()))
+            else:
+                result.append(region)
+        self.regions = result
+
+    def subtract(self, region):
+        self.regions = [r for r in self.regions if not (region.begin() <= r.begin() and r.end() <= region.end())]
+
+
+# ====================================================
+# View over an in-memory buffer
+# ====================================================
+class View:
+    def __init__(self, text='', fileName=None, syntax=None, window=None):
+        self.viewId = _nextId()
+        self.text = text
+        self.fileName = fileName
+        self.viewName = ''
+        self.changeCount = 0
+        self.dirty = False
+        self.valid = True
+        self.statuses = {}
+        self.folds = []
+        self.selection = Selection()
+        self.viewSettings = Settings({'tab_size': 4, 'syntax': syntax or 'Packages/Text/Plain text.tmLanguage'})
+        self.parent = window
+        self.lineStarts = None
+        if window is not None:
+            window.views_.append(self)
+
+    def id(self):
+        return self.viewId
+
+    def buffer_id(self):
+        return self.viewId
+
+    def is_valid(self):
+        return self.valid
+
+    def close(self):
+        self.valid = False
+        if self.parent is not None:
+            self.parent.views_ = [v for v in self.parent.views_ if v is not self]
+        return True
+
+    def window(self):
+        return self.parent
+
+    def file_name(self):
+        return self.fileName
+
+    def name(self):
+        return self.viewName
+
+    def set_name(self, name):
+        self.viewName = name
+
+    def size(self):
+        return len(self.text)
+
+    def settings(self):
+        return self.viewSettings
+
+    def sel(self):
+        return self.selection
+
+    def is_dirty(self):
+        return self.dirty
+
+    def is_loading(self):
+        return False
+
+    def change_count(self):
+        return self.changeCount
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self.text[x.begin():x.end()]
+        return self.text[x:x + 1]
+
+    def set_status(self, key, value):
+        self.statuses[key] = value
+
+    def get_status(self, key):
+        return self.statuses.get(key, '')
+
+    def erase_status(self, key):
+        self.statuses.pop(key, None)
+
+    def folded_regions(self):
+        return list(self.folds)
+
+    def fold(self, regions):
+        if isinstance(regions, Region):
+            regions = [regions]
+        self.folds = sorted(self.folds + list(regions))
+        return True
+
+    def show(self, x, show_surrounds=True):
+        pass
+
+    def show_at_center(self, x):
+        pass
+
+    def run_command(self, name, args=None):
+        if name == 'invert_selection':
+            inverted = []
+            start = 0
+            for region in self.selection.regions:
+                if region.begin() > start:
+                    inverted.append(Region(start, region.begin()))
+                start = region.end()
+            if start < self.size():
+                inverted.append(Region(start, self.size()))
+            self.selection.clear()
+            self.selection.add_all(inverted)
+
+    # --------------------------------
+    # Text edits (harness side)
+    # --------------------------------
+    def replace_text(self, begin, end, text):
+        self.text = self.text[:begin] + text + self.text[end:]
+        self.changeCount += 1
+        self.dirty = True
+        self.lineStarts = None
+
+    # --------------------------------
+    # Rows, columns and lines
+    # --------------------------------
+    def LineStarts(self):
+        if self.lineStarts is None:
+            starts = [0]
+            find = self.text.find
+            pos = find('\n')
+            while pos >= 0:
+                starts.append(pos + 1)
+                pos = find('\n', pos + 1)
+            self.lineStarts = starts
+        return self.lineStarts
+
+    def rowcol(self, point):
+        starts = self.LineStarts()
+        row = bisect.bisect_right(starts, point) - 1
+        return (row, point - starts[row])
+
+    def text_point(self, row, col):
+        starts = self.LineStarts()
+        row = max(0, min(row, len(starts) - 1))
+        return min(starts[row] + col, self.size())
+
+    def line(self, x):
+        if isinstance(x, Region):
+            return Region(self.line(x.begin()).begin(), self.line(x.end()).end())
+        begin = self.text.rfind('\n', 0, x) + 1
+        end = self.text.find('\n', x)
+        if end < 0:
+            end = len(self.text)
+        return Region(begin, end)
+
+    def full_line(self, x):
+        region = self.line(x)
+        end = region.end() + 1 if region.end() < len(self.text) else region.end()
+        return Region(region.begin(), end)
+
+    def lines(self, region):
+        result = []
+        point = region.begin()
+        while True:
+            line = self.line(point)
+            result.append(line)
+            if line.end() >= region.end() or line.end() >= len(self.text):
+                break
+            point = line.end() + 1
+        return result
+
+    def split_by_newlines(self, region):
+        return self.lines(region)
+
+
+# ====================================================
+# Window
+# ====================================================
+class Window:
+    def __init__(self):
+        self.windowId = _nextId()
+        self.views_ = []
+        self.activeView = None
+        self.projectData = None
+        self.projectFileName = None
+        self.quickPanels = []
+        self.inputPanels = []
+        self.statusMessages = []
+        self.commands = []
+        self.projectDataWrites = 0
+        _windows.append(self)
+
+    def id(self):
+        return self.windowId
+
+    def new_file(self):
+        view = View(window=self)
+        self.activeView = view
+        return view
+
+    def open_file(self, path, flags=0):
+        for view in self.views_:
+            if view.fileName == path:
+                self.activeView = view
+                return view
+        text = ''
+        if os.path.isfile(path):
+            with open(path, encoding='utf-8', errors='replace') as file:
+                text = file.read()
+        view = View(text, path, window=self)
+        self.activeView = view
+        return view
+
+    def views(self):
+        return list(self.views_)
+
+    def active_view(self):
+        return self.activeView
+
+    def focus_view(self, view):
+        self.activeView = view
+
+    def folders(self):
+        data = self.projectData or {}
+        return [block['path'] for block in data.get('folders', [])]
+
+    def project_data(self):
+        if self.projectData is None:
+            return None
+        import copy
+        return copy.deepcopy(self.projectData)
+
+    def set_project_data(self, data):
+        import copy
+        self.projectDataWrites += 1
+        self.projectData = copy.deepcopy(data)
+
+    def project_file_name(self):
+        return self.projectFileName
+
+    def extract_variables(self):
+        variables = {'packages': packages_path()}
+        if self.activeView is not None and self.activeView.fileName:
+            variables['file'] = self.activeView.fileName
+            variables['file_path'] = os.path.dirname(self.activeView.fileName)
+        return variables
+
+    def status_message(self, msg):
+        self.statusMessages.append(msg)
+
+    def run_command(self, name, args=None):
+        self.commands.append((name, args))
+
+    def set_sidebar_visible(self, visible):
+        pass
+
+    # Panels are recorded; the harness picks
+    # an item by calling the stored callback.
+    def show_quick_panel(self, items, on_select, flags=0, selected_index=-1, on_highlight=None, placeholder=None):
+        self.quickPanels.append((items, on_select, on_highlight))
+
+    def show_input_panel(self, caption, initial_text, on_done, on_change, on_cancel):
+        self.inputPanels.append((caption, initial_text, on_done))
+        return View(initial_text)
@@ -0,0 +1,53 @@
+# ====================================================
+# Headless stand-in for Sublime Text's sublime_plugin.
+# ====================================================
+
+
+class Command:
+    def name(self):
+        return ''
+
+    def is_enabled(self, *args, **kwargs):
+        return True
+
+    def is_visible(self, *args, **kwargs):
+        return True
+
+
+class ApplicationCommand(Command):
+    pass
+
+
+class WindowCommand(Command):
+    def __init__(self, window):
+        self.window = window
+
+
+class TextCommand(Command):
+    def __init__(self, view):
+        self.view = view
+
+
+class EventListener:
+    pass
+
+
+class ViewEventListener:
+    def __init__(self, view):
+        self.view = view
+
+
+class TextChangeListener:
+    def __init__(self):
+        self.buffer = None
+
+    def attach(self, buffer):
+        self.buffer = buffer
+
+
+class ListInputHandler:
+    pass
+
+
+class TextInputHandler:
+    pass
@@ -1,11 +1,17 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
 import sublime
 import sublime_plugin
 import os
-import subprocess
+import threading
+import time
+
 
 # ---------------------------------------------------
 # Make RenameFile available as window command.
 # ---------------------------------------------------
+@timed
 class RenameFileUtilCommand(sublime_plugin.WindowCommand):
 	def run(self):
 		filename = self.window.active_view().file_name()
@@ -14,6 +20,7 @@ class RenameFileUtilCommand(sublime_plugin.WindowCommand):
 # ---------------------------------------------------
 # Pop out current file in new window.
 # ---------------------------------------------------
+@timed
 class PopOutFileCommand(sublime_plugin.WindowCommand):
 	def run(self):
 		window = self.window
@@ -28,6 +35,287 @@ class PopOutFileCommand(sublime_plugin.WindowCommand):
 		else:
 			window.status_message("Pop: unsaved file not supported.")
 
+# ---------------------------------------------------
+# Background file job.
+# Runs on a worker thread, reports progress in the
+# status bar and can be cancelled (one job per window).
+# ---------------------------------------------------
+class FileJobCancelled(Exception):
+	pass
+
+class FileJob(object):
+	RUNNING = {}
+	PROGRESS_INTERVAL = 0.25
+	BUFFER_SIZE = 1024 * 1024
+	COPY_STEP = 64 * 1024 * 1024
+
+	def __init__(self, window, label):
+		self.window = window
+		self.label = label
+		self.cancelled = False
+		self.lastProgress = 0
+
+	@classmethod
+	def get(cls, window):
+		return cls.RUNNING.get(window.id())
+
+	def start(self):
+		if FileJob.get(self.window) is not None:
+			self.window.status_message("{0}: another file job is running.".format(self.label))
+			return
+		FileJob.RUNNING[self.window.id()] = self
+		thread = threading.Thread(target=self.main)
+		thread.daemon = True
+		thread.start()
+
+	def cancel(self):
+		self.cancelled = True
+
+	def main(self):
+		try:
+			msg = self.work()
+		except FileJobCancelled:
+			msg = "{0}: cancelled.".format(self.label)
+		except (OSError, ValueError) as e:
+			msg = "{0}: {1}".format(self.label, e)
+		finally:
+			FileJob.RUNNING.pop(self.window.id(), None)
+		self.status(msg)
+
+	def work(self):
+		raise NotImplementedError()
+
+	def progress(self, done, total):
+		if self.cancelled:
+			raise FileJobCancelled()
+		now = time.time()
+		if now - self.lastProgress >= self.PROGRESS_INTERVAL:
+			self.lastProgress = now
+			percent = 100 * done // total if total > 0 else 100
+			self.status("{0}: {1}%... (cancel with 'File job: Cancel')".format(self.label, percent))
+
+	def copy(self, src, dst, offset, count, done, total):
+		end = offset + count
+		while offset < end:
+			step = min(self.COPY_STEP, end - offset)
+			copyRange(src, dst, offset, step)
+			offset += step
+			self.progress(done + offset, total)
+
+	def status(self, msg):
+		window = self.window
+		sublime.set_timeout(lambda: window.status_message(msg), 0)
+
+@timed
+class FileJobCancelCommand(sublime_plugin.WindowCommand):
+	def run(self):
+		job = FileJob.get(self.window)
+		if job is not None:
+			job.cancel()
+
+	def is_enabled(self):
+		return FileJob.get(self.window) is not None
+
+# ---------------------------------------------------
+# Copy a byte range between files without going through
+# Python objects when the kernel can do it:
+# copy_file_range, then sendfile, then a buffered copy.
+# ---------------------------------------------------
+def kernelCopyErrors():
+	import errno
+	return (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTSOCK, errno.EOPNOTSUPP)
+
+def copyRange(src, dst, offset, count):
+	end = offset + count
+	if hasattr(os, 'copy_file_range'):
+		try:
+			while offset < end:
+				copied = os.copy_file_range(src.fileno(), dst.fileno(), end - offset, offset)
+				if copied == 0:
+					break
+				offset += copied
+			return
+		except OSError as e:
+			if e.errno not in kernelCopyErrors():
+				raise
+	if hasattr(os, 'sendfile'):
+		try:
+			while offset < end:
+				copied = os.sendfile(dst.fileno(), src.fileno(), offset, end - offset)
+				if copied == 0:
+					break
+				offset += copied
+			return
+		except OSError as e:
+			if e.errno not in kernelCopyErrors():
+				raise
+	src.seek(offset)
+	while offset < end:
+		data = src.read(min(FileJob.BUFFER_SIZE, end - offset))
+		if not data:
+			break
+		dst.write(data)
+		offset += len(data)
+
+def partPath(filename, index):
+	base, ext = os.path.splitext(filename)
+	return "{0}_part{1}{2}".format(base, index, ext)
+
+def findParts(filename):
+	import re
+	directory, name = os.path.split(filename)
+	base, ext = os.path.splitext(name)
+	match = re.match(r'^(.*)_part\d+$', base)
+	if match:
+		base = match.group(1)
+	pattern = re.compile('^' + re.escape(base) + r'_part(\d+)' + re.escape(ext) + '$')
+	parts = []
+	for entry in os.listdir(directory):
+		match = pattern.match(entry)
+		if match:
+			parts.append((int(match.group(1)), os.path.join(directory, entry)))
+	parts.sort()
+	return os.path.join(directory, base + ext), [path for index, path in parts]
+
+def countLines(path):
+	count = 0
+	with open(path, 'rb') as file:
+		while True:
+			chunk = file.read(FileJob.BUFFER_SIZE)
+			if not chunk:
+				return count
+			count += chunk.count(b'\n')
+
+def getSplitSource(window):
+	view = window.active_view()
+	filename = view.file_name() if view is not None else None
+	if not filename:
+		window.status_message("Split: No file is currently open.")
+		return None
+	if view.is_dirty():
+		window.status_message("Split: Save the file first, parts are read from disk.")
+		return None
+	return filename
+
+# ---------------------------------------------------
+# Split a file on disk every N lines.
+# Streams fixed-size chunks, so memory stays constant
+# whatever the file size. Parts keep the original bytes,
+# line endings included.
+# ---------------------------------------------------
+class SplitByLinesJob(FileJob):
+	def __init__(self, window, filename, linesPerFile):
+		FileJob.__init__(self, window, "Split")
+		self.filename = filename
+		self.linesPerFile = linesPerFile
+
+	def work(self):
+		total = os.path.getsize(self.filename)
+		done = 0
+		parts = 0
+		needed = self.linesPerFile
+		out = None
+		try:
+			with open(self.filename, 'rb') as src:
+				while True:
+					chunk = src.read(self.BUFFER_SIZE)
+					if not chunk:
+						break
+					pos = 0
+					while pos < len(chunk):
+						if out is None:
+							parts += 1
+							out = open(partPath(self.filename, parts), 'wb')
+						# The current part may end in this chunk.
+						count = chunk.count(b'\n', pos)
+						if count < needed:
+							out.write(chunk[pos:])
+							needed -= count
+							pos = len(chunk)
+						else:
+							end = pos
+							for i in range(needed):
+								end = chunk.find(b'\n', end) + 1
+							out.write(chunk[pos:end])
+							out.close()
+							out = None
+							needed = self.linesPerFile
+							pos = end
+					done += len(chunk)
+					self.progress(done, total)
+		finally:
+			if out is not None:
+				out.close()
+		return "Split: File split into {0} parts.".format(parts)
+
+# ---------------------------------------------------
+# Split a file on disk every N bytes.
+# Cuts snap to the nearest line end, found by scanning
+# a memory-mapped view of the file; parts are written
+# with kernel-side copies.
+# ---------------------------------------------------
+class SplitBySizeJob(FileJob):
+	def __init__(self, window, filename, bytesPerFile):
+		FileJob.__init__(self, window, "Split")
+		self.filename = filename
+		self.bytesPerFile = bytesPerFile
+
+	def findCuts(self, data, size):
+		cuts = []
+		start = 0
+		while size - start > self.bytesPerFile:
+			target = start + self.bytesPerFile
+			candidates = []
+			after = data.find(b'\n', target - 1)
+			if after >= 0:
+				candidates.append(after + 1)
+			before = data.rfind(b'\n', start, target - 1)
+			if before >= 0:
+				candidates.append(before + 1)
+			candidates = [cut for cut in candidates if start < cut < size]
+			if not candidates:
+				break
+			start = min(candidates, key=lambda cut: abs(cut - target))
+			cuts.append(start)
+		return cuts
+
+	def work(self):
+		import mmap
+		size = os.path.getsize(self.filename)
+		with open(self.filename, 'rb') as src:
+			cuts = []
+			if size > self.bytesPerFile:
+				data = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+				try:
+					cuts = self.findCuts(data, size)
+				finally:
+					data.close()
+			start = 0
+			for index, end in enumerate(cuts + [size]):
+				with open(partPath(self.filename, index + 1), 'wb') as dst:
+					self.copy(src, dst, start, end - start, 0, size)
+				start = end
+		return "Split: File split into {0} parts.".format(len(cuts) + 1)
+
+# ---------------------------------------------------
+# Split options: "1000" lines, or a size like "100MB".
+# ---------------------------------------------------
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+def parseSplitOption(text):
+	text = text.strip().upper()
+	for unit, factor in SIZE_UNITS.items():
+		if text.endswith(unit):
+			return ('bytes', int(float(text[:-len(unit)].strip()) * factor))
+	return ('lines', int(text))
+
+def startSplit(window, filename, option):
+	mode, value = option
+	if mode == 'bytes':
+		SplitBySizeJob(window, filename, value).start()
+	else:
+		SplitByLinesJob(window, filename, value).start()
+
 # ---------------------------------------------------
 # Split current file into multiple files based on line count
 # ---------------------------------------------------
@@ -40,7 +328,10 @@ class SplitFileListInputHandler(sublime_plugin.ListInputHandler):
 			["10,000 lines per file", "10000"],
 			["5,000 lines per file", "5000"],
 			["1,000 lines per file", "1000"],
-			["Custom number of lines...", "custom"]
+			["1 GB per file", "1GB"],
+			["100 MB per file", "100MB"],
+			["10 MB per file", "10MB"],
+			["Custom number of lines or size...", "custom"]
 		]
 
 class SplitFileCustomInputHandler(sublime_plugin.TextInputHandler):
@@ -48,57 +339,40 @@ class SplitFileCustomInputHandler(sublime_plugin.TextInputHandler):
 		return "lines_per_file"
 		
 	def placeholder(self):
-		return "Enter number of lines per file"
+		return "Enter number of lines per file, or a size like 100MB"
 		
 	def initial_text(self):
 		return "10000"
 		
 	def validate(self, text):
 		try:
-			value = int(text)
+			mode, value = parseSplitOption(text)
 			return value > 0
 		except ValueError:
 			return False
 
+@timed
 class SplitFileCustomCommand(sublime_plugin.WindowCommand):
 	def input(self, args):
 		return SplitFileCustomInputHandler()
 		
 	def run(self, lines_per_file):
-		view = self.window.active_view()
-		filename = view.file_name()
-
+		filename = getSplitSource(self.window)
 		if not filename:
-			self.window.status_message("Split: No file is currently open.")
 			return
-			
-		# Get the content of the file
-		content = view.substr(sublime.Region(0, view.size()))
-		lines = content.split('\n')
 		
 		try:
-			lines_per_file = int(lines_per_file)
-			if lines_per_file <= 0:
+			option = parseSplitOption(str(lines_per_file))
+			if option[1] <= 0:
 				self.window.status_message("Split: Please enter a positive number.")
 				return
 		except ValueError:
 			self.window.status_message("Split: Please enter a valid number.")
 			return
 			
-		# Get the base filename and extension
-		base, ext = os.path.splitext(filename)
-		
-		# Split the lines into chunks
-		for i in range(0, len(lines), lines_per_file):
-			chunk = lines[i:i + lines_per_file]
-			chunk_filename = "{0}_part{1}{2}".format(base, i//lines_per_file + 1, ext)
-			
-			# Write the chunk to a new file
-			with open(chunk_filename, 'w', encoding='utf-8') as f:
-				f.write('\n'.join(chunk))
-				
-		self.window.status_message("Split: File split into {0} parts.".format(len(lines)//lines_per_file + 1))
+		startSplit(self.window, filename, option)
 
+@timed
 class SplitFileCommand(sublime_plugin.WindowCommand):
 	def input(self, args):
 		return SplitFileListInputHandler()
@@ -114,29 +388,81 @@ class SplitFileCommand(sublime_plugin.WindowCommand):
 				},
 			)
 		else:
-			view = self.window.active_view()
-			filename = view.file_name()
-			
+			filename = getSplitSource(self.window)
 			if not filename:
-				self.window.status_message("Split: No file is currently open.")
 				return
 				
-			# Get the content of the file
-			content = view.substr(sublime.Region(0, view.size()))
-			lines = content.split('\n')
-			
-			lines_per_file = int(split_option)
-			
-			# Get the base filename and extension
-			base, ext = os.path.splitext(filename)
-			
-			# Split the lines into chunks
-			for i in range(0, len(lines), lines_per_file):
-				chunk = lines[i:i + lines_per_file]
-				chunk_filename = "{0}_part{1}{2}".format(base, i//lines_per_file + 1, ext)
-				
-				# Write the chunk to a new file
-				with open(chunk_filename, 'w', encoding='utf-8') as f:
-					f.write('\n'.join(chunk))
-					
-			self.window.status_message("Split: File split into {0} parts.".format(len(lines)//lines_per_file + 1))
\ No newline at end of file
+			startSplit(self.window, filename, parseSplitOption(split_option))
+
+# ---------------------------------------------------
+# Join name_part1.ext ... name_partN.ext back into
+# name.ext (or name_joined.ext when name.ext exists,
+# which is then used to verify the result).
+# ---------------------------------------------------
+class JoinPartsJob(FileJob):
+	def __init__(self, window, original, parts):
+		FileJob.__init__(self, window, "Join")
+		self.original = original
+		self.parts = parts
+
+	def work(self):
+		target = self.original
+		if os.path.exists(self.original):
+			base, ext = os.path.splitext(self.original)
+			target = "{0}_joined{1}".format(base, ext)
+		sizes = [os.path.getsize(path) for path in self.parts]
+		total = sum(sizes)
+		temp = target + ".joining"
+		try:
+			with open(temp, 'wb') as dst:
+				done = 0
+				for path, size in zip(self.parts, sizes):
+					with open(path, 'rb') as src:
+						self.copy(src, dst, 0, size, done, total)
+					done += size
+			os.replace(temp, target)
+		except Exception:
+			if os.path.exists(temp):
+				os.remove(temp)
+			raise
+
+		joinedSize = os.path.getsize(target)
+		if joinedSize != total:
+			return "Join: {0} is {1} bytes, parts total {2} bytes.".format(target, joinedSize, total)
+		joinedLines = countLines(target)
+		if target != self.original:
+			originalSize = os.path.getsize(self.original)
+			originalLines = countLines(self.original)
+			if (joinedSize, joinedLines) != (originalSize, originalLines):
+				return "Join: {0} differs from original ({1} bytes, {2} lines vs {3} bytes, {4} lines).".format(
+					os.path.basename(target), joinedSize, joinedLines, originalSize, originalLines)
+		return "Join: {0} parts joined into {1} ({2} bytes, {3} lines).".format(
+			len(self.parts), os.path.basename(target), joinedSize, joinedLines)
+
+@timed
+class JoinFilePartsCommand(sublime_plugin.WindowCommand):
+	def run(self, paths=None):
+		if paths:
+			filename = paths[0]
+		else:
+			view = self.window.active_view()
+			filename = view.file_name() if view is not None else None
+		if not filename:
+			self.window.status_message("Join: No file is currently open.")
+			return
+
+		original, parts = findParts(filename)
+		if not parts:
+			self.window.status_message("Join: No parts found for {0}.".format(os.path.basename(original)))
+			return
+		for index, path in enumerate(parts):
+			if path != partPath(original, index + 1):
+				self.window.status_message("Join: Part {0} is missing.".format(index + 1))
+				return
+
+		JoinPartsJob(self.window, original, parts).start()
+
+	def is_visible(self, paths=None):
+		return paths is None or (len(paths) > 0 and os.path.isfile(paths[0]))
+
+Metrics.StopLoad(__name__, LOAD_START)
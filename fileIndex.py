@@ -0,0 +1,316 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
+import sublime
+import sublime_plugin
+import fnmatch
+import os
+import re
+import threading
+
+from .projects import ProjectManager, KEY_FOLDERS, KEY_PATH, KEY_FOLDER_EXCLUDE
+
+KEY_FILE_EXCLUDE = 'file_exclude_patterns'
+INDEX_VERSION = 1
+
+
+# ----------------------------------------
+# True when the characters of query appear in
+# text in order. Each character is found from
+# the previous one, so the cost is linear and
+# a miss stops at the first missing character.
+# The last character must exist far enough
+# after the first: most misses stop there.
+# ----------------------------------------
+def isSubsequence(text, query):
+    pos = text.find(query[0])
+    if pos < 0 or text.rfind(query[-1]) < pos + len(query) - 1:
+        return False
+    for c in query[1:]:
+        pos = text.find(c, pos + 1)
+        if pos < 0:
+            return False
+    return True
+
+# ====================================================
+# File Index
+# Every file under the folders of a saved project.
+# Kept on disk between sessions; an update only lists
+# again the directories whose mtime changed.
+# ====================================================
+class FileIndex:
+    MAX_CANDIDATES = 20000
+    MAX_RESULTS = 500
+    indexes = {}
+    lock = threading.Lock()
+
+    # --------------------------------
+    # Class
+    # --------------------------------
+    @classmethod
+    def Get(cls, project):
+        key = project.path or '\n'.join(project.GetFolders())
+        with cls.lock:
+            index = cls.indexes.get(key)
+            if index is None:
+                index = FileIndex(key)
+                cls.indexes[key] = index
+        index.SetProject(project)
+        return index
+
+    @classmethod
+    def GetIndexDir(cls):
+        return os.path.join(sublime.cache_path(), 'subl-utils', 'file-index')
+
+    @classmethod
+    def CompilePatterns(cls, patterns):
+        if not patterns:
+            return None
+        return re.compile('|'.join(fnmatch.translate(p) for p in patterns))
+
+    # --------------------------------
+    # Constructor
+    # --------------------------------
+    def __init__(self, key):
+        import hashlib
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(FileIndex.GetIndexDir(), digest + '.json')
+        self.roots = []
+        self.dirs = None
+        self.files = []
+        self.lowers = []
+        self.lock = threading.Lock()
+        self.updating = False
+        self.waiting = []
+
+    # --------------------------------
+    # Private
+    # --------------------------------
+    def SetProject(self, project):
+        prefs = sublime.load_settings('Preferences.sublime-settings')
+        roots = []
+        for block in project.data.get(KEY_FOLDERS, []):
+            folderPatterns = list(prefs.get(KEY_FOLDER_EXCLUDE, [])) + block.get(KEY_FOLDER_EXCLUDE, [])
+            filePatterns = list(prefs.get(KEY_FILE_EXCLUDE, [])) + block.get(KEY_FILE_EXCLUDE, [])
+            roots.append((
+                block[KEY_PATH],
+                FileIndex.CompilePatterns(folderPatterns),
+                FileIndex.CompilePatterns(filePatterns)
+                ))
+        self.roots = roots
+
+    def LoadFromDisk(self):
+        import json
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+            if saved.get('version') == INDEX_VERSION:
+                return saved['dirs']
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def SaveOnDisk(self, dirs):
+        import json
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as file:
+            json.dump({'version': INDEX_VERSION, 'dirs': dirs}, file)
+        os.replace(temp, self.path)
+
+    def ListDir(self, dir, folderExclude, fileExclude):
+        files = []
+        subdirs = []
+        with os.scandir(dir) as it:
+            for e in it:
+                try:
+                    isDir = e.is_dir()
+                except OSError:
+                    continue
+                if isDir:
+                    if folderExclude is None or not folderExclude.match(e.name):
+                        subdirs.append(e.name)
+                elif fileExclude is None or not fileExclude.match(e.name):
+                    files.append(e.name)
+        return files, subdirs
+
+    # --------------------------------
+    # Walk the folders, reusing the saved
+    # listing of any directory whose mtime
+    # did not change.
+    # --------------------------------
+    def Walk(self, old):
+        dirs = {}
+        files = []
+        changed = False
+        for root, folderExclude, fileExclude in self.roots:
+            label = os.path.basename(root.rstrip('\\/')) or root
+            stack = [(root, label)]
+            while stack:
+                dir, rel = stack.pop()
+                try:
+                    mtime = os.stat(dir).st_mtime_ns
+                except OSError:
+                    changed = True
+                    continue
+                entry = old.get(dir)
+                if entry is None or entry[0] != mtime:
+                    try:
+                        names, subdirs = self.ListDir(dir, folderExclude, fileExclude)
+                    except OSError:
+                        changed = True
+                        continue
+                    entry = [mtime, names, subdirs]
+                    changed = True
+                dirs[dir] = entry
+                for name in entry[1]:
+                    files.append((rel + '/' + name, os.path.join(dir, name)))
+                for name in reversed(entry[2]):
+                    stack.append((os.path.join(dir, name), rel + '/' + name))
+        if len(dirs) != len(old):
+            changed = True
+        return dirs, files, changed
+
+    # --------------------------------
+    # Public
+    # --------------------------------
+    def Update(self):
+        old = self.dirs
+        if old is None:
+            old = self.LoadFromDisk()
+        dirs, files, changed = self.Walk(old)
+        lowers = [rel.lower() for rel, path in files]
+        with self.lock:
+            self.dirs = dirs
+            self.files = files
+            self.lowers = lowers
+        if changed:
+            try:
+                self.SaveOnDisk(dirs)
+            except OSError as e:
+                print("Project: could not save file index; " + str(e))
+
+    # Update in the background, then call
+    # onReady on the main thread.
+    def UpdateAsync(self, onReady=None):
+        with self.lock:
+            if onReady is not None:
+                self.waiting.append(onReady)
+            if self.updating:
+                return
+            self.updating = True
+
+        def update():
+            try:
+                self.Update()
+            finally:
+                with self.lock:
+                    self.updating = False
+                    waiting = self.waiting
+                    self.waiting = []
+            for callback in waiting:
+                sublime.set_timeout(callback, 0)
+        sublime.set_timeout_async(update, 0)
+
+    # Call onReady on the main thread once
+    # the index is loaded and not updating.
+    def WhenReady(self, onReady):
+        with self.lock:
+            ready = self.dirs is not None and not self.updating
+        if ready:
+            sublime.set_timeout(onReady, 0)
+        else:
+            self.UpdateAsync(onReady)
+
+    # --------------------------------
+    # Fuzzy search.
+    # Candidates are the paths holding the query
+    # as a subsequence, up to MAX_CANDIDATES;
+    # they are ranked next. Takes a while on
+    # large projects: call it off the UI thread.
+    # --------------------------------
+    def Search(self, query):
+        query = query.lower().replace(' ', '').replace('\\', '/')
+        with self.lock:
+            files = self.files
+            lowers = self.lowers
+        if not query or not files:
+            return []
+
+        candidates = []
+        for i, lower in enumerate(lowers):
+            if isSubsequence(lower, query):
+                candidates.append(i)
+                if len(candidates) >= FileIndex.MAX_CANDIDATES:
+                    break
+
+        results = []
+        for i in candidates:
+            rel, path = files[i]
+            results.append((self.Score(lowers[i], rel, query), rel, path))
+        results.sort(key=lambda result: -result[0])
+        return [(rel, path) for score, rel, path in results[:FileIndex.MAX_RESULTS]]
+
+    def Score(self, lower, rel, query):
+        name = lower[lower.rfind('/') + 1:]
+        score = 0
+        if name.startswith(query):
+            score += 300
+        elif query in name:
+            score += 200
+        elif query in lower:
+            score += 100
+        elif isSubsequence(name, query):
+            score += 50
+        return score - len(rel) * 0.1
+
+
+# ----------------------------------------
+# PaletteCommand:
+# Find a file in a saved project, open or not
+# ----------------------------------------
+@timed
+class ProjectFindFileCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        self.manager = ProjectManager(self.window)
+        self.manager.PromptSelectProject(self.PromptSelectProjectDone)
+
+    def PromptSelectProjectDone(self, index):
+        projects = self.manager.projects
+        if index < 0 or not projects:
+            return
+        self.index = FileIndex.Get(projects[index])
+        self.index.UpdateAsync()
+        self.window.show_input_panel("Find file", "", self.PromptQueryDone, None, None)
+
+    def PromptQueryDone(self, query):
+        self.query = query
+        if self.index.updating:
+            sublime.status_message("Project: indexing files...")
+        self.index.WhenReady(self.SearchAsync)
+
+    def SearchAsync(self):
+        def search():
+            results = self.index.Search(self.query)
+            sublime.set_timeout(lambda: self.ShowResults(results), 0)
+        sublime.set_timeout_async(search, 0)
+
+    def ShowResults(self, results):
+        self.results = results
+        promptItems = [[os.path.basename(rel), rel] for rel, path in self.results]
+        if len(promptItems) < 1:
+            promptItems.append(["None", "No file matches '{0}'.".format(self.query)])
+        self.window.show_quick_panel(
+            promptItems,
+            self.PromptFileDone,
+            sublime.MONOSPACE_FONT,
+            0,
+            None
+            )
+
+    def PromptFileDone(self, index):
+        if 0 <= index < len(self.results):
+            rel, path = self.results[index]
+            self.window.open_file(path)
+
+Metrics.StopLoad(__name__, LOAD_START)
@@ -0,0 +1,375 @@
+from .perf import Metrics
+LOAD_START = Metrics.StartLoad()
+
+import os
+import struct
+import threading
+import time
+
+
+# ====================================================
+# Git Repo
+# Branch and state of a git repository, read from the
+# files under .git without running git. Every file
+# read is cached with its stat key, so asking again
+# costs a few stats. Directories outside any repository
+# are remembered for MAX_AGE seconds, so a repository
+# created later is found.
+# ====================================================
+class GitRepo:
+    MAX_AGE = 300
+    repos = {}
+    roots = {}
+    expires = time.monotonic() + MAX_AGE
+    checks = []
+    worker = None
+    lock = threading.Lock()
+    INDEX_HEADER = struct.Struct('>4sII')
+    INDEX_ENTRY = struct.Struct('>IIIIIIIIII20sH')
+    GITLINK = 0o160000
+
+    # --------------------------------
+    # Class
+    # --------------------------------
+    # The repository containing dir, or None.
+    # Walking up stops at the first directory
+    # already known, and every directory walked
+    # is remembered.
+    @classmethod
+    def Find(cls, dir):
+        walked = []
+        found = None
+        with cls.lock:
+            if time.monotonic() > cls.expires:
+                cls.roots = dict((d, f) for d, f in cls.roots.items() if f is not None)
+                cls.expires = time.monotonic() + cls.MAX_AGE
+        while True:
+            with cls.lock:
+                if dir in cls.roots:
+                    found = cls.roots[dir]
+                    break
+            walked.append(dir)
+            gitDir = cls.GetGitDir(dir)
+            if gitDir is not None:
+                found = (dir, gitDir)
+                break
+            parent = os.path.dirname(dir)
+            if parent == dir:
+                break
+            dir = parent
+
+        with cls.lock:
+            for walkedDir in walked:
+                cls.roots[walkedDir] = found
+            if found is None:
+                return None
+            repo = cls.repos.get(found[1])
+        if repo is None:
+            repo = GitRepo(*found)
+            with cls.lock:
+                repo = cls.repos.setdefault(found[1], repo)
+        return repo
+
+    # .git is a directory, or a file pointing
+    # to one (worktrees, submodules).
+    @classmethod
+    def GetGitDir(cls, dir):
+        path = os.path.join(dir, '.git')
+        if os.path.isdir(path):
+            return path
+        try:
+            with open(path) as file:
+                text = file.read().strip()
+        except OSError:
+            return None
+        if not text.startswith('gitdir:'):
+            return None
+        return os.path.normpath(os.path.join(dir, text[len('gitdir:'):].strip()))
+
+    # Dirty checks run one at a time on their own
+    # thread: they stat every tracked file, and would
+    # hold up every other callback on the async one.
+    @classmethod
+    def QueueCheck(cls, repo):
+        with cls.lock:
+            cls.checks.append(repo)
+            if cls.worker is None:
+                cls.worker = threading.Thread(target=cls.RunChecks, name='subl-utils-git')
+                cls.worker.daemon = True
+                cls.worker.start()
+
+    @classmethod
+    def RunChecks(cls):
+        while True:
+            with cls.lock:
+                if not cls.checks:
+                    cls.worker = None
+                    return
+                repo = cls.checks.pop(0)
+            try:
+                repo.IsDirty()
+                checked = True
+            except Exception as e:
+                print("Git: could not check {0}; {1}".format(repo.workTree, e))
+                checked = False
+            with repo.lock:
+                repo.checking = False
+                waiting = repo.waiting
+                repo.waiting = []
+            # Without a result, asking again would
+            # only fail again.
+            if checked:
+                for onDone in waiting:
+                    onDone()
+
+    # --------------------------------
+    # Constructor
+    # --------------------------------
+    def __init__(self, workTree, gitDir):
+        self.workTree = workTree
+        self.gitDir = gitDir
+        self.name = os.path.basename(workTree) or workTree
+        self.files = {}
+        self.dirty = None
+        self.tracked = None
+        self.checking = False
+        self.waiting = []
+        self.lock = threading.Lock()
+        self.commonDir = gitDir
+        commonDir = self.ReadText(os.path.join(gitDir, 'commondir'))
+        if commonDir:
+            self.commonDir = os.path.normpath(os.path.join(gitDir, commonDir.strip()))
+
+    # --------------------------------
+    # Public
+    # --------------------------------
+    # Branch name, or the short commit id
+    # when HEAD is detached.
+    def GetBranch(self):
+        head = (self.ReadText(os.path.join(self.gitDir, 'HEAD')) or '').strip()
+        if head.startswith('ref: '):
+            ref = head[len('ref: '):]
+            return ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else ref
+        return head[:7]
+
+    # True when the branch points to another
+    # commit than its upstream: ahead, behind or
+    # both, telling which takes reading objects.
+    def IsOutOfSync(self):
+        branch = self.GetBranch()
+        upstream = self.GetUpstream(branch)
+        if upstream is None:
+            return False
+        local = self.ResolveRef('refs/heads/' + branch)
+        remote = self.ResolveRef(upstream)
+        return local is not None and remote is not None and local != remote
+
+    # True when a tracked file differs from the
+    # index by size or mtime, or is missing.
+    # Staged and untracked files do not count.
+    # Stats every tracked file: GetDirty runs it
+    # off the async thread. The result is cached
+    # until the index changes or MarkSaved is
+    # called.
+    def IsDirty(self):
+        key = self.StatKey(os.path.join(self.gitDir, 'index'))
+        with self.lock:
+            if self.dirty is not None and self.dirty[0] == key:
+                return self.dirty[1]
+        dirty = self.CheckIndex()
+        with self.lock:
+            self.dirty = (key, dirty)
+        return dirty
+
+    # IsDirty when known for the current index.
+    # Otherwise None: the check is queued, and
+    # onDone is called from the worker once the
+    # result is cached.
+    def GetDirty(self, onDone):
+        key = self.StatKey(os.path.join(self.gitDir, 'index'))
+        with self.lock:
+            if self.dirty is not None and self.dirty[0] == key:
+                return self.dirty[1]
+            self.waiting.append(onDone)
+            if self.checking:
+                return None
+            self.checking = True
+        GitRepo.QueueCheck(self)
+        return None
+
+    # A saved tracked file no longer matches the
+    # index mtime: the repository is dirty, no need
+    # to check every file. Reads the index names
+    # (no stat) once per index change. Returns
+    # False when path is not tracked.
+    def MarkSaved(self, path):
+        try:
+            name = os.path.relpath(path, self.workTree)
+        except ValueError:
+            return False # Another drive.
+        if name == os.curdir or name.startswith(os.pardir + os.sep):
+            return False
+        name = os.fsencode(name.replace(os.sep, '/'))
+        key = self.StatKey(os.path.join(self.gitDir, 'index'))
+        with self.lock:
+            tracked = self.tracked
+        if tracked is None or tracked[0] != key:
+            tracked = (key, frozenset(entry[0] for entry in self.ReadIndex()))
+            with self.lock:
+                self.tracked = tracked
+        if name not in tracked[1]:
+            return False
+        with self.lock:
+            self.dirty = (key, True)
+        return True
+
+    # --------------------------------
+    # Private
+    # --------------------------------
+    def StatKey(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    # File content, parsed by parse, cached
+    # until the file's stat key changes.
+    def ReadCached(self, path, parse):
+        key = self.StatKey(path)
+        with self.lock:
+            cached = self.files.get(path)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+        value = None
+        if key is not None:
+            try:
+                with open(path) as file:
+                    value = parse(file.read())
+            except (OSError, ValueError, UnicodeDecodeError):
+                value = None
+        with self.lock:
+            self.files[path] = (key, value)
+        return value
+
+    def ReadText(self, path):
+        return self.ReadCached(path, lambda text: text)
+
+    def ResolveRef(self, ref):
+        sha = self.ReadText(os.path.join(self.commonDir, ref))
+        if sha:
+            return sha.strip()
+        packed = self.ReadCached(os.path.join(self.commonDir, 'packed-refs'), self.ParsePackedRefs)
+        return packed.get(ref) if packed else None
+
+    def ParsePackedRefs(self, text):
+        refs = {}
+        for line in text.splitlines():
+            if not line or line[0] in '#^':
+                continue
+            sha, _, ref = line.partition(' ')
+            refs[ref.strip()] = sha
+        return refs
+
+    # refs/remotes/<remote>/<branch> from the
+    # branch's remote and merge settings.
+    def GetUpstream(self, branch):
+        config = self.ReadCached(os.path.join(self.commonDir, 'config'), self.ParseConfig)
+        if not config:
+            return None
+        section = config.get('branch "{0}"'.format(branch), {})
+        remote = section.get('remote')
+        merge = section.get('merge')
+        if not remote or not merge or remote == '.':
+            return None
+        if merge.startswith('refs/heads/'):
+            merge = merge[len('refs/heads/'):]
+        return 'refs/remotes/{0}/{1}'.format(remote, merge)
+
+    def ParseConfig(self, text):
+        config = {}
+        section = None
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if line.startswith('['):
+                section = config.setdefault(line.strip('[]').strip(), {})
+            elif section is not None:
+                key, _, value = line.partition('=')
+                section[key.strip().lower()] = value.strip().strip('"')
+        return config
+
+    # --------------------------------
+    # Index: compare each entry's size and
+    # mtime with the working tree file.
+    # --------------------------------
+    def CheckIndex(self):
+        for name, mode, flags, skipWorktree, size, mtime, mtimeNs in self.ReadIndex():
+            if (flags >> 12) & 3:
+                return True # Merge conflict.
+            if flags & 0x8000 or skipWorktree or mode & 0o170000 == self.GITLINK:
+                continue
+            try:
+                stat = os.lstat(os.path.join(self.workTree, os.fsdecode(name)))
+            except OSError:
+                return True
+            if stat.st_size & 0xFFFFFFFF != size or int(stat.st_mtime) != mtime:
+                return True
+            if mtimeNs and stat.st_mtime_ns % 1000000000 != mtimeNs:
+                return True
+        return False
+
+    # Entries of the index, versions 2 to 4 of the
+    # format: (name, mode, flags, skipWorktree,
+    # size, mtime, mtimeNs).
+    def ReadIndex(self):
+        try:
+            with open(os.path.join(self.gitDir, 'index'), 'rb') as file:
+                data = file.read()
+        except OSError:
+            return
+        # A truncated index reads as the entries
+        # before the break.
+        try:
+            signature, version, count = self.INDEX_HEADER.unpack_from(data, 0)
+            if signature != b'DIRC' or version not in (2, 3, 4):
+                return
+            offset = self.INDEX_HEADER.size
+            name = b''
+            for _ in range(count):
+                (ctime, ctimeNs, mtime, mtimeNs, dev, ino, mode, uid, gid, size, sha, flags
+                    ) = self.INDEX_ENTRY.unpack_from(data, offset)
+                entryStart = offset
+                offset += self.INDEX_ENTRY.size
+                skipWorktree = False
+                if flags & 0x4000:
+                    extended = struct.unpack_from('>H', data, offset)[0]
+                    skipWorktree = bool(extended & 0x4000)
+                    offset += 2
+                if version == 4:
+                    strip, offset = self.ReadVarint(data, offset)
+                    end = data.index(b'\0', offset)
+                    name = name[:len(name) - strip] + data[offset:end]
+                    offset = end + 1
+                else:
+                    end = data.index(b'\0', offset)
+                    name = data[offset:end]
+                    # Entries are padded with 1 to 8 NULs
+                    # to a multiple of 8 bytes.
+                    offset = entryStart + ((end - entryStart + 8) & ~7)
+                yield (name, mode, flags, skipWorktree, size, mtime, mtimeNs)
+        except (struct.error, ValueError, IndexError):
+            return
+
+    def ReadVarint(self, data, offset):
+        c = data[offset]
+        offset += 1
+        value = c & 127
+        while c & 128:
+            c = data[offset]
+            offset += 1
+            value = ((value + 1) << 7) | (c & 127)
+        return value, offset
+
+Metrics.StopLoad(__name__, LOAD_START)
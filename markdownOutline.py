@@ -0,0 +1,185 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
+import sublime
+import sublime_plugin
+import bisect
+
+from .setTitle import iterHeadings
+
+
+def isMarkdown(view):
+    syntax = view.settings().get('syntax')
+    return bool(syntax) and 'Markdown' in syntax
+
+
+# ----------------------------------------
+# Where a point goes when begin..end is
+# replaced by length characters. A point
+# inside the replaced text goes to the start
+# of the new text, or to its end with after.
+# ----------------------------------------
+def movePoint(point, change, after):
+    begin, end, length = change
+    if point < begin:
+        return point
+    if point >= end:
+        return point + length - (end - begin)
+    return begin + length if after else begin
+
+
+# ====================================================
+# Outline
+# Every heading of a buffer as (begin, end, level, title),
+# sorted. Built once by a full scan, then kept current
+# from the edited regions: headings past an edit move,
+# and only the lines around it are scanned again.
+# ====================================================
+class Outline:
+    outlines = {}
+
+    # --------------------------------
+    # Class
+    # --------------------------------
+    # The outline of the view's buffer, built
+    # or rebuilt when it missed changes.
+    @classmethod
+    def Get(cls, view):
+        outline = cls.outlines.get(view.buffer_id())
+        if outline is None or outline.changeCount != view.change_count():
+            outline = Outline(view)
+            cls.outlines[view.buffer_id()] = outline
+        return outline
+
+    @classmethod
+    def Drop(cls, bufferId):
+        cls.outlines.pop(bufferId, None)
+
+    # --------------------------------
+    # Constructor
+    # --------------------------------
+    def __init__(self, view):
+        self.headings = list(iterHeadings(view.substr(sublime.Region(0, view.size()))))
+        self.begins = [heading[0] for heading in self.headings]
+        self.changeCount = view.change_count()
+
+    # --------------------------------
+    # Public
+    # --------------------------------
+    # changes: (begin, end, inserted length) in
+    # the positions of the text before each one.
+    def Update(self, view, changes):
+        dirty = []
+        for change in changes:
+            begin, end, length = change
+            delta = length - (end - begin)
+            # Headings end in order: the ones before
+            # the change stay, the ones after it move.
+            first = self.IndexAt(begin)
+            if first < 0 or self.headings[first][1] < begin:
+                first += 1
+            last = bisect.bisect_left(self.begins, end)
+            self.headings[first:] = [(movePoint(b, change, False), movePoint(e, change, True), level, title)
+                for b, e, level, title in self.headings[first:last]] + [(b + delta, e + delta, level, title)
+                for b, e, level, title in self.headings[last:]]
+            self.begins[first:] = [heading[0] for heading in self.headings[first:]]
+            dirty = [(movePoint(b, change, False), movePoint(e, change, True)) for b, e in dirty]
+            dirty.append((begin, begin + length))
+
+        for begin, end in dirty:
+            self.Rescan(view, begin, end)
+        self.changeCount = view.change_count()
+
+    # Index of the heading at or before point.
+    def IndexAt(self, point):
+        return bisect.bisect_right(self.begins, point) - 1
+
+    # --------------------------------
+    # Private
+    # --------------------------------
+    # Headings touching the edited lines are
+    # replaced by what a scan of those lines,
+    # plus one line on each side, finds now.
+    def Rescan(self, view, begin, end):
+        edited = view.line(sublime.Region(begin, end))
+        scan = sublime.Region(
+            view.line(max(0, edited.begin() - 1)).begin(),
+            view.line(min(view.size(), edited.end() + 1)).end())
+        found = [heading for heading in iterHeadings(view.substr(scan), scan.begin())
+            if heading[0] <= edited.end() and heading[1] >= edited.begin()]
+        last = self.IndexAt(edited.end()) + 1
+        first = last
+        while first > 0 and self.headings[first - 1][1] >= edited.begin():
+            first -= 1
+        self.headings[first:last] = found
+        self.begins[first:last] = [heading[0] for heading in found]
+
+
+# ----------------------------------------
+# Keep outlines current while buffers are
+# edited (Sublime Text 4; on 3, an outline
+# is rebuilt when its change count is old).
+# ----------------------------------------
+if hasattr(sublime_plugin, 'TextChangeListener'):
+    @timed
+    class MarkdownOutlineChangeListener(sublime_plugin.TextChangeListener):
+        def on_text_changed(self, changes):
+            outline = Outline.outlines.get(self.buffer.id())
+            if outline is None:
+                return
+            view = self.buffer.primary_view()
+            if view is None or not isMarkdown(view):
+                Outline.Drop(self.buffer.id())
+                return
+            outline.Update(view, [(c.a.pt, c.b.pt, len(c.str)) for c in changes])
+
+@timed
+class MarkdownOutlineEvent(sublime_plugin.EventListener):
+    def on_close(self, view):
+        Outline.Drop(view.buffer_id())
+
+
+# ----------------------------------------
+# PaletteCommand:
+# Jump to a heading of the Markdown file
+# ----------------------------------------
+@timed
+class MarkdownGotoHeadingCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        view = self.view
+        self.outline = Outline.Get(view)
+        self.headings = list(self.outline.headings)
+        if len(self.headings) < 1:
+            sublime.status_message("Markdown: no heading.")
+            return
+        self.origin = [sublime.Region(s.a, s.b) for s in view.sel()]
+        current = self.outline.IndexAt(self.origin[0].begin()) if self.origin else 0
+        promptItems = [["  " * (level - 1) + title, "line {0}".format(view.rowcol(begin)[0] + 1)]
+            for begin, end, level, title in self.headings]
+        view.window().show_quick_panel(
+            promptItems,
+            self.PromptHeadingDone,
+            sublime.MONOSPACE_FONT,
+            max(0, current),
+            self.PromptHeadingHighlighted
+            )
+
+    def PromptHeadingHighlighted(self, index):
+        if 0 <= index < len(self.headings):
+            self.view.show_at_center(self.headings[index][0])
+
+    def PromptHeadingDone(self, index):
+        view = self.view
+        view.sel().clear()
+        if 0 <= index < len(self.headings):
+            view.sel().add(sublime.Region(self.headings[index][0]))
+            view.show_at_center(self.headings[index][0])
+        else:
+            view.sel().add_all(self.origin)
+            if self.origin:
+                view.show(self.origin[0])
+
+    def is_enabled(self):
+        return isMarkdown(self.view)
+
+Metrics.StopLoad(__name__, LOAD_START)
@@ -1,12 +1,17 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
 import sublime
 import sublime_plugin
 import os
 import sys
-import subprocess
+
+from .projects import ProjectManager
 
 # --------------------------------
 # Open path in FileManager
 # --------------------------------
+@timed
 class OpenInFileManager(sublime_plugin.WindowCommand):
     def run(self, path):  
         variables = self.window.extract_variables()
@@ -39,6 +44,7 @@ class OpenInFileManager(sublime_plugin.WindowCommand):
             cmd = cmdLinux
             opts = [ optLinux ]    
         
+        import subprocess
         if os.path.isdir(path):
             subprocess.Popen([cmd, path])
         else:
@@ -51,40 +57,31 @@ class OpenInFileManager(sublime_plugin.WindowCommand):
         # os.startfile(path)
 
 # --------------------------------
-# Add folder to current window.
+# Add folders to current window.
+# Takes one path, or a list of paths
+# added in a single project update.
 # --------------------------------
+@timed
 class AddFolderCommand(sublime_plugin.WindowCommand):
-    def run(self, path):
-        variables = self.window.extract_variables()
-        path = sublime.expand_variables(path, variables)
-        path = os.path.expandvars(path)
-        path = path.replace('/', '\\')
+    def run(self, path=None, paths=None):
+        paths = list(paths or [])
+        if path is not None:
+            paths.append(path)
 
-        project = self.window.project_data()
-        if project is None:
-            project = { 'folders' : [] }
-        else:
-            # If user removes last folder by right-click in sidebar,
-            # then the key 'folders' is removed from the dictionary.
-            # Odd, but heh, here's a fix.
-            if 'folders' not in project:
-                project['folders'] = []
-        
-        folderAlreadyAdded = False
-        for folder in project['folders']:
-            # print(folder)
-            if folder['path'] == path:
-                folderAlreadyAdded = True
-                break
+        variables = self.window.extract_variables()
+        expanded = []
+        for path in paths:
+            path = sublime.expand_variables(path, variables)
+            path = os.path.expandvars(path)
+            expanded.append(path)
 
-        if folderAlreadyAdded == False:
-            project['folders'].append({ 'path': path })
-            self.window.set_project_data(project)
+        ProjectManager(self.window).AddFolders(expanded)
 
 # --------------------------------
 # Open folder from the sidebar 
 # in FileManager.
 # --------------------------------
+@timed
 class OpenFolder(sublime_plugin.WindowCommand):
     def run(self, paths):
         for path in paths:
@@ -97,6 +94,7 @@ class OpenFolder(sublime_plugin.WindowCommand):
 # --------------------------------
 # Open file using default program.
 # --------------------------------
+@timed
 class OpenFileUsingShell(sublime_plugin.WindowCommand):
     def run(self, files):
         for x in files:
@@ -113,8 +111,10 @@ class OpenFileUsingShell(sublime_plugin.WindowCommand):
 # --------------------------------
 # Open file using FilePilot.
 # --------------------------------
+@timed
 class OpenFileUsingFilePilot(sublime_plugin.WindowCommand):
     def run(self, files):
+        import subprocess
         filepilot_path = os.path.join(os.environ['USERPROFILE'], 'AppData', 'Local', 'Voidstar', 'FilePilot', 'FPilot.exe')
         for x in files:
             subprocess.Popen([filepilot_path, x])
@@ -122,11 +122,15 @@ class OpenFileUsingFilePilot(sublime_plugin.WindowCommand):
     def is_visible(self, files):
         return len(files) > 0
 
+@timed
 class OpenFolderUsingFilePilotCommand(sublime_plugin.WindowCommand):
     def run(self, dirs):
+        import subprocess
         filepilot_path = os.path.join(os.environ['USERPROFILE'], 'AppData', 'Local', 'Voidstar', 'FilePilot', 'FPilot.exe')
         for x in dirs:
             subprocess.Popen([filepilot_path, x])
 
     def is_visible(self, dirs):
-        return len(dirs) > 0
\ No newline at end of file
+        return len(dirs) > 0
+
+Metrics.StopLoad(__name__, LOAD_START)
@@ -0,0 +1,119 @@
+from .perf import Metrics
+LOAD_START = Metrics.StartLoad()
+
+import functools
+import os
+import threading
+
+
+# ----------------------------------------
+# Shorten path by hiding directories,
+# excluding the root: at most maxDirs
+# directories are kept before the name.
+# Results are cached, paths repeat a lot.
+# ----------------------------------------
+@functools.lru_cache(maxsize=4096)
+def shortenPath(path, maxDirs):
+    path = os.path.normpath(path)
+    parts = [part for part in path.split(os.sep) if part]
+    dirCount = len(parts) - 1 # Minus fileName.
+    # The root is always kept: nothing to hide
+    # unless there are more directories.
+    if dirCount <= maxDirs + 1:
+        return path
+
+    # Keep leading separators: "/" or "\\server".
+    root = path[:len(path) - len(path.lstrip(os.sep))]
+    return root + os.sep.join([parts[0], '...'] + parts[-1 - maxDirs:])
+
+
+# ====================================================
+# Path Presenter
+# How paths are shown in the status bar and panels.
+# ====================================================
+class PathPresenter:
+    statuses = {}
+    lock = threading.Lock()
+
+    # --------------------------------
+    # Status bar
+    # --------------------------------
+    # Set (or erase, for None) a status only when
+    # it differs from the last one set for the view.
+    @classmethod
+    def SetStatus(cls, view, key, value):
+        token = (view.id(), key)
+        with cls.lock:
+            if cls.statuses.get(token) == value:
+                return
+            if value is None:
+                cls.statuses.pop(token, None)
+            else:
+                cls.statuses[token] = value
+        if value is None:
+            view.erase_status(key)
+        else:
+            view.set_status(key, value)
+
+    @classmethod
+    def Forget(cls, view):
+        viewId = view.id()
+        with cls.lock:
+            for token in [token for token in cls.statuses if token[0] == viewId]:
+                del cls.statuses[token]
+
+    # Shorten path, keeping more directories
+    # while it would read the same as one of
+    # the other paths (same file name, other dir).
+    @classmethod
+    def ShortenAmong(cls, path, others, maxDirs):
+        name = os.path.basename(path)
+        others = [other for other in others if other != path and os.path.basename(other) == name]
+        shortened = shortenPath(path, maxDirs)
+        while others and '...' in shortened:
+            if all(shortenPath(other, maxDirs) != shortened for other in others):
+                break
+            maxDirs += 1
+            shortened = shortenPath(path, maxDirs)
+        return shortened
+
+    # --------------------------------
+    # Quick panels
+    # --------------------------------
+    # One label per path: its name, followed by as
+    # many parent directories as needed to tell
+    # apart paths with the same name. suffix is
+    # appended to the name ("/" for folders).
+    @classmethod
+    def Labels(cls, paths, suffix=''):
+        parts = [os.path.normpath(path).rstrip('\\/').split(os.sep) for path in paths]
+        depths = [1] * len(paths)
+        while True:
+            labels = [os.sep.join(p[-depth:]) for p, depth in zip(parts, depths)]
+            counts = {}
+            for label in labels:
+                counts[label] = counts.get(label, 0) + 1
+            grown = False
+            for i, label in enumerate(labels):
+                if counts[label] > 1 and depths[i] < len(parts[i]):
+                    depths[i] += 1
+                    grown = True
+            if not grown:
+                return [cls.Label(p, depth, suffix) for p, depth in zip(parts, depths)]
+
+    @classmethod
+    def Label(cls, parts, depth, suffix):
+        name = (parts[-1] or os.sep) + suffix
+        if depth < 2:
+            return name
+        return "{0} - {1}".format(name, os.sep.join(parts[-depth:-1]))
+
+    # Detail line for a path in a quick panel.
+    @classmethod
+    def Detail(cls, path):
+        home = os.path.expanduser('~')
+        if path == home or path.startswith(home + os.sep):
+            path = '~' + path[len(home):]
+        return shortenPath(path, 4)
+
+Metrics.StopLoad(__name__, LOAD_START)
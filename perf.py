@@ -0,0 +1,145 @@
+import sublime
+import sublime_plugin
+import functools
+import threading
+import time
+
+
+# ====================================================
+# Metrics
+# Call count, total, max and a latency histogram per
+# callback. The histogram has one bucket per power of
+# two microseconds, so memory stays fixed per callback.
+# ====================================================
+class Metrics:
+    BUCKETS = 32
+    PERCENTILES = (0.5, 0.9, 0.99)
+    entries = {}
+    loads = {}
+    loadSpan = [None, None]
+    lock = threading.Lock()
+
+    # ----------------------------------------
+    # Module load time: a module takes LOAD_START
+    # before its imports and reports at its end.
+    # A module importing another includes its time.
+    # ----------------------------------------
+    @classmethod
+    def StartLoad(cls):
+        start = time.perf_counter()
+        with cls.lock:
+            if cls.loadSpan[0] is None:
+                cls.loadSpan[0] = start
+        return start
+
+    @classmethod
+    def StopLoad(cls, module, start):
+        stop = time.perf_counter()
+        with cls.lock:
+            cls.loads[module.rsplit('.', 1)[-1]] = stop - start
+            cls.loadSpan[1] = stop
+
+    @classmethod
+    def Record(cls, name, seconds):
+        micros = int(seconds * 1000000)
+        bucket = min(micros.bit_length(), cls.BUCKETS - 1)
+        with cls.lock:
+            entry = cls.entries.get(name)
+            if entry is None:
+                entry = [0, 0.0, 0.0, [0] * cls.BUCKETS]
+                cls.entries[name] = entry
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3][bucket] += 1
+
+    # Bucket i holds [2^(i-1), 2^i) microseconds;
+    # interpolate linearly inside the bucket.
+    @classmethod
+    def Percentile(cls, buckets, count, percentile):
+        rank = percentile * count
+        cumulative = 0
+        for i, n in enumerate(buckets):
+            if n == 0:
+                continue
+            if cumulative + n >= rank:
+                lower = 2 ** (i - 1) if i > 0 else 0
+                upper = 2 ** i
+                return (lower + (upper - lower) * (rank - cumulative) / n) / 1000000
+            cumulative += n
+        return 0.0
+
+    @classmethod
+    def Report(cls):
+        with cls.lock:
+            entries = [(name, list(entry[:3]) + [list(entry[3])]) for name, entry in cls.entries.items()]
+        entries.sort(key=lambda item: -item[1][1])
+
+        header = "{0:<64} {1:>7} {2:>10} {3:>9} {4:>9} {5:>9} {6:>9}".format(
+            "Callback", "Calls", "Total ms", "p50 ms", "p90 ms", "p99 ms", "Max ms")
+        lines = [header, "-" * len(header)]
+        for name, (count, total, high, buckets) in entries:
+            percentiles = [min(cls.Percentile(buckets, count, p), high) * 1000 for p in cls.PERCENTILES]
+            lines.append("{0:<64} {1:>7} {2:>10.1f} {3:>9.3f} {4:>9.3f} {5:>9.3f} {6:>9.3f}".format(
+                name, count, total * 1000, percentiles[0], percentiles[1], percentiles[2], high * 1000))
+
+        with cls.lock:
+            loads = sorted(cls.loads.items(), key=lambda item: -item[1])
+            first, last = cls.loadSpan
+        lines.append("")
+        lines.append("{0:<64} {1:>10}".format("Module load", "ms"))
+        lines.append("-" * len(header))
+        for module, seconds in loads:
+            lines.append("{0:<64} {1:>10.2f}".format(module, seconds * 1000))
+        if first is not None and last is not None:
+            lines.append("{0:<64} {1:>10.2f}".format("First to last module", (last - first) * 1000))
+        return lines
+
+    @classmethod
+    def Reset(cls):
+        with cls.lock:
+            cls.entries.clear()
+
+
+# ----------------------------------------
+# Decorator: on a class, time run() and every
+# on_* event callback it defines; on a
+# function (plugin_loaded...), time the function.
+# ----------------------------------------
+def timed(cls):
+    module = cls.__module__.rsplit('.', 1)[-1]
+    if not isinstance(cls, type):
+        return timedMethod(cls, "{0}.{1}".format(module, cls.__name__))
+    for attr, value in list(vars(cls).items()):
+        if callable(value) and (attr == 'run' or attr.startswith('on_')):
+            setattr(cls, attr, timedMethod(value, "{0}.{1}.{2}".format(module, cls.__name__, attr)))
+    return cls
+
+def timedMethod(method, name):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            Metrics.Record(name, time.perf_counter() - start)
+    return wrapper
+
+
+# ----------------------------------------
+# PaletteCommand:
+# Print call counts and latency percentiles
+# ----------------------------------------
+class UtilsPerformanceReportCommand(sublime_plugin.WindowCommand):
+    def run(self, reset=False):
+        if reset:
+            Metrics.Reset()
+            sublime.status_message("Utils: performance metrics reset.")
+            return
+        print("==========================")
+        print("~ Performance Report ~")
+        print("")
+        for line in Metrics.Report():
+            print(line)
+        print("==========================")
+        sublime.status_message("Utils: performance report printed to console.")
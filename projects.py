@@ -1,9 +1,15 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
 import sublime
-import sublime_api
 import sublime_plugin
-import errno
 import os
-import json
+import math
+import threading
+import time
+
+from .paths import PathPresenter
+from .watcher import Watcher, PollWatcher, SelfTest, ADDED, DELETED, RESET
 
 KEY_SETTINGS = 'settings'
 KEY_DEFAULTDIR = 'default_dir'
@@ -13,13 +19,18 @@ KEY_SETTINGS = 'settings'
 KEY_FOLDER_EXCLUDE = 'folder_exclude_patterns'
 FILE_EXT = ".sublime-project"
 
+# Loading, watching and ranking projects start with
+# the first project command, not at editor startup.
+@timed
 def plugin_loaded():
     base_dir = sublime.packages_path()
-    rel_dir = "user\\projects"
-    dir = os.path.join(base_dir, rel_dir)
+    dir = os.path.join(base_dir, 'User', 'projects')
     ProjectManager.PROJECTS_DIR = dir
     return
 
+def plugin_unloaded():
+    ProjectWriter.Flush()
+
 
 # ====================================================
 # Project
@@ -42,15 +53,20 @@ class Project:
         filename = os.path.basename(path)
         return os.path.splitext(filename)[0]
 
+    # The file's settings are kept; default_dir
+    # is set to the first folder.
     @classmethod
     def LoadFromPath(cls, path):
+        import json
         with open(path) as file:
             data = json.load(file)
         folders = cls.GetFoldersFromData(data)
         name = 'Project Name'
         if len(folders) > 0:
             name = cls.GetNameFromPath(path)
-            data[KEY_SETTINGS] = {KEY_DEFAULTDIR: folders[0]}
+            settings = dict(data.get(KEY_SETTINGS) or {})
+            settings[KEY_DEFAULTDIR] = folders[0]
+            data[KEY_SETTINGS] = settings
         return Project(name, path, data)
 
     @classmethod
@@ -75,6 +91,7 @@ class Project:
         self.name = name
         self.path = path
         self.data = data
+        self.oldPath = None
 
     # --------------------------------
     # Private
@@ -91,26 +108,630 @@ class Project:
     def SaveOnDisk(self):
         if self.path == None or self.path == '':
             self.path = self.GeneratePath()
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        with open(self.path, 'w') as file:
-            json.dump(self.data, file)
+        ProjectWriter.Schedule(self.path, self.data, self.oldPath)
+        self.oldPath = None
         return self.path
 
     def DeleteFromDisk(self):
+        ProjectWriter.Cancel(self.path)
         try:
             os.remove(self.path)
             return self.path
         except OSError as e:
-            print( "Project file could not be delete: " + e )
+            print( "Project file could not be delete: " + str(e) )
             return None
+        finally:
+            ProjectCache.Invalidate(self.path)
 
     def GetFolders(self):
         return Project.GetFoldersFromData(self.data)
 
+    # The old file is removed by the next save.
     def Rename(self, newName):
+        if self.path and self.oldPath is None:
+            self.oldPath = self.path
         self.name = newName
         self.path = self.GeneratePath()
-        
+
+
+# ====================================================
+# Folder Set
+# The folders of project data, indexed by normalized
+# path (separators, trailing slashes, and case where the
+# filesystem ignores it), so bulk changes skip
+# duplicates in O(1) per folder.
+# ====================================================
+class FolderSet:
+    @classmethod
+    def Normalize(cls, path):
+        return os.path.normcase(os.path.normpath(path))
+
+    def __init__(self, data):
+        self.data = dict(data) if data else {}
+        self.blocks = []
+        self.index = {}
+        self.changed = False
+        # If the last folder is removed from the sidebar,
+        # the key 'folders' is missing altogether.
+        for block in self.data.get(KEY_FOLDERS, []):
+            self.AddBlock(block)
+
+    def AddBlock(self, block):
+        key = FolderSet.Normalize(block[KEY_PATH])
+        if key in self.index:
+            return False
+        self.index[key] = block
+        self.blocks.append(block)
+        return True
+
+    def Add(self, paths):
+        count = 0
+        for path in paths:
+            if self.AddBlock({ KEY_PATH : os.path.normpath(path) }):
+                count += 1
+        self.changed = self.changed or count > 0
+        return count
+
+    # Keeps the blocks' own settings (exclude patterns...).
+    def Append(self, blocks):
+        count = 0
+        for block in blocks:
+            if self.AddBlock(dict(block)):
+                count += 1
+        self.changed = self.changed or count > 0
+        return count
+
+    def Remove(self, paths):
+        removed = set()
+        for path in paths:
+            block = self.index.pop(FolderSet.Normalize(path), None)
+            if block is not None:
+                removed.add(id(block))
+        if removed:
+            self.blocks = [block for block in self.blocks if id(block) not in removed]
+            self.changed = True
+        return len(removed)
+
+    def GetPaths(self):
+        return [block[KEY_PATH] for block in self.blocks]
+
+    def GetData(self):
+        self.data[KEY_FOLDERS] = self.blocks
+        return self.data
+
+
+# ====================================================
+# Project Writer
+# Saves are written behind: a burst of saves of the same
+# file becomes one write, made to a temp file, fsynced
+# and renamed over the target. A rename writes the new
+# file and removes the old one in the same step.
+# ====================================================
+class ProjectWriter:
+    DELAY = 300
+    pending = {}
+    scheduled = False
+    lock = threading.Lock()
+
+    @classmethod
+    def Schedule(cls, path, data, oldPath=None):
+        with cls.lock:
+            removes = []
+            if oldPath and oldPath != path:
+                removes.append(oldPath)
+                # Renamed before its last save was written.
+                previous = cls.pending.pop(oldPath, None)
+                if previous is not None:
+                    removes.extend(previous[1])
+            previous = cls.pending.get(path)
+            if previous is not None:
+                removes.extend(previous[1])
+            cls.pending[path] = (data, [p for p in removes if p != path])
+            if not cls.scheduled:
+                cls.scheduled = True
+                sublime.set_timeout_async(cls.Flush, cls.DELAY)
+
+    @classmethod
+    def Cancel(cls, path):
+        with cls.lock:
+            cls.pending.pop(path, None)
+
+    @classmethod
+    def Flush(cls):
+        with cls.lock:
+            pending = cls.pending
+            cls.pending = {}
+            cls.scheduled = False
+        for path, (data, removes) in pending.items():
+            try:
+                cls.Write(path, data, removes)
+            except (OSError, TypeError, ValueError) as e:
+                print("Project: could not save {0}; {1}".format(path, e))
+
+    @classmethod
+    def Write(cls, path, data, removes):
+        import json
+        import tempfile
+        dir = os.path.dirname(path)
+        os.makedirs(dir, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(data, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp, path)
+        except Exception:
+            os.remove(temp)
+            raise
+        for old in removes:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+            ProjectCache.Invalidate(old)
+        cls.SyncDir(dir)
+        ProjectCache.Reload(path)
+
+    # Make the rename itself durable.
+    @classmethod
+    def SyncDir(cls, dir):
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(dir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# ====================================================
+# Project Cache
+# Parsed project files shared by all windows, keyed by
+# path and validated with (mtime, size): only files that
+# changed since the last listing are parsed again.
+# ====================================================
+class ProjectCache:
+    POOL_SIZE = 8
+    entries = {}
+    lock = threading.Lock()
+    pool = None
+    watchedDir = None
+    trusted = False
+    # Bumped on every change to entries.
+    version = 0
+    folderSet = None
+
+    # ----------------------------------------
+    # While the directory is watched, events
+    # keep the entries current and listings
+    # skip the directory scan.
+    # ----------------------------------------
+    @classmethod
+    def Watch(cls, dir):
+        watcher = Watcher.Get()
+        if cls.watchedDir == dir and watcher.IsWatching(dir, cls.OnEvent):
+            return
+        try:
+            watcher.Watch(dir, cls.OnEvent, contents=True)
+        except OSError as e:
+            print("Project: cannot watch {0}; {1}".format(dir, e))
+            return
+        with cls.lock:
+            cls.watchedDir = dir
+            cls.trusted = False
+
+    @classmethod
+    def OnEvent(cls, event, path):
+        if event == RESET:
+            with cls.lock:
+                cls.trusted = False
+            return
+        if not path.endswith(FILE_EXT):
+            return
+        if event == DELETED:
+            cls.Drop(path)
+            return
+        cls.Reload(path)
+
+    @classmethod
+    def IsTrusted(cls, dir):
+        with cls.lock:
+            return cls.trusted and cls.watchedDir == dir
+
+    # ----------------------------------------
+    # List project files with their stat key.
+    # ----------------------------------------
+    @classmethod
+    def Scan(cls, dir):
+        files = []
+        with os.scandir(dir) as it:
+            for entry in it:
+                if entry.name.endswith(FILE_EXT) and entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.path, (stat.st_mtime_ns, stat.st_size)))
+        with cls.lock:
+            paths = set(path for path, key in files)
+            for path in list(cls.entries):
+                if path not in paths:
+                    del cls.entries[path]
+                    cls.version += 1
+            if cls.watchedDir == dir:
+                cls.trusted = True
+        return files
+
+    @classmethod
+    def IsStale(cls, path, key):
+        with cls.lock:
+            entry = cls.entries.get(path)
+        return entry is None or entry[0] != key
+
+    # ----------------------------------------
+    # Parse one file. A broken file is cached
+    # with its error, so it is reported but not
+    # parsed again until it changes.
+    # ----------------------------------------
+    @classmethod
+    def Load(cls, path, key):
+        try:
+            project = Project.LoadFromPath(path)
+            entry = (key, project.name, project.data)
+        except Exception as e:
+            entry = (key, None, e)
+        with cls.lock:
+            cls.entries[path] = entry
+            cls.version += 1
+
+    @classmethod
+    def Get(cls, path):
+        with cls.lock:
+            entry = cls.entries.get(path)
+        if entry is None or entry[1] is None:
+            return None
+        key, name, data = entry
+        return Project(name, path, data)
+
+    @classmethod
+    def GetError(cls, path):
+        with cls.lock:
+            entry = cls.entries.get(path)
+        if entry is None or entry[1] is not None:
+            return None
+        return entry[2]
+
+    @classmethod
+    def GetPool(cls):
+        with cls.lock:
+            if cls.pool is None:
+                import concurrent.futures
+                cls.pool = concurrent.futures.ThreadPoolExecutor(max_workers=cls.POOL_SIZE)
+            return cls.pool
+
+    # ----------------------------------------
+    # Returns (projects, [(path, error)]).
+    # Stale files are parsed on the thread pool
+    # when parallel is set.
+    # ----------------------------------------
+    @classmethod
+    def GetProjects(cls, dir, parallel=False):
+        cls.Watch(dir)
+        if cls.IsTrusted(dir):
+            Watcher.Get().Refresh(dir)
+            with cls.lock:
+                files = [(path, entry[0]) for path, entry in cls.entries.items()]
+        else:
+            files = cls.Scan(dir)
+        stale = [(path, key) for path, key in files if cls.IsStale(path, key)]
+        if parallel and len(stale) > 1:
+            list(cls.GetPool().map(lambda item: cls.Load(*item), stale))
+        else:
+            for path, key in stale:
+                cls.Load(path, key)
+
+        projects = []
+        errors = []
+        for path, key in files:
+            project = cls.Get(path)
+            if project is not None:
+                projects.append(project)
+            else:
+                errors.append((path, cls.GetError(path)))
+        return projects, errors
+
+    # ----------------------------------------
+    # Normalized folders of every cached project,
+    # rebuilt only after the entries changed.
+    # ----------------------------------------
+    @classmethod
+    def GetFolderSet(cls):
+        with cls.lock:
+            if cls.folderSet is None or cls.folderSet[0] != cls.version:
+                folders = set()
+                for key, name, data in cls.entries.values():
+                    if name is not None:
+                        for block in data.get(KEY_FOLDERS, []):
+                            folders.add(FolderSet.Normalize(block[KEY_PATH]))
+                cls.folderSet = (cls.version, frozenset(folders))
+            return cls.folderSet[1]
+
+    # ----------------------------------------
+    # Forget everything (the next listing then
+    # scans the directory), or one file. While
+    # the directory is trusted, listings come
+    # from the entries alone: the file is read
+    # again rather than dropped, or it would
+    # vanish from them.
+    # ----------------------------------------
+    @classmethod
+    def Invalidate(cls, path=None):
+        if path is None:
+            with cls.lock:
+                cls.entries.clear()
+                cls.trusted = False
+                cls.version += 1
+        elif cls.IsTrusted(os.path.dirname(path)):
+            cls.Reload(path)
+        else:
+            cls.Drop(path)
+
+    # Read the file again, or drop it when gone.
+    @classmethod
+    def Reload(cls, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            cls.Drop(path)
+            return
+        cls.Load(path, (stat.st_mtime_ns, stat.st_size))
+
+    @classmethod
+    def Drop(cls, path):
+        with cls.lock:
+            cls.entries.pop(path, None)
+            cls.version += 1
+
+
+# ====================================================
+# Project Usage
+# Open events go to an append-only log and feed a
+# frecency score: each open adds exp(RATE * (t - EPOCH)).
+# Scores are kept as logs, so an event costs O(1) and
+# scores from any time compare directly. The log is
+# compacted to one score line per project as it grows.
+# ====================================================
+class ProjectUsage:
+    HALF_LIFE = 14 * 24 * 3600
+    RATE = math.log(2) / HALF_LIFE
+    EPOCH = 1577836800
+    COMPACT_MIN = 1000
+    COMPACT_FACTOR = 4
+    scores = None
+    lines = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def GetLogPath(cls):
+        return os.path.join(sublime.cache_path(), 'subl-utils', 'project-usage.log')
+
+    @classmethod
+    def AddScore(cls, scores, path, score):
+        old = scores.get(path)
+        if old is None:
+            scores[path] = score
+        else:
+            high, low = max(old, score), min(old, score)
+            scores[path] = high + math.log1p(math.exp(low - high))
+
+    # ----------------------------------------
+    # Lines are "<time>\t<path>" for an open,
+    # "=<log score>\t<path>" once compacted.
+    # ----------------------------------------
+    @classmethod
+    def Load(cls):
+        with cls.lock:
+            if cls.scores is not None:
+                return
+            scores = {}
+            lines = 0
+            try:
+                with open(cls.GetLogPath(), encoding='utf-8') as file:
+                    for line in file:
+                        value, sep, path = line.rstrip('\n').partition('\t')
+                        if not sep:
+                            continue
+                        try:
+                            if value.startswith('='):
+                                score = float(value[1:])
+                            else:
+                                score = cls.RATE * (float(value) - cls.EPOCH)
+                        except ValueError:
+                            continue
+                        cls.AddScore(scores, path, score)
+                        lines += 1
+            except OSError:
+                pass
+            cls.scores = scores
+            cls.lines = lines
+
+    @classmethod
+    def Record(cls, path):
+        now = time.time()
+        def record():
+            cls.Load()
+            with cls.lock:
+                cls.AddScore(cls.scores, path, cls.RATE * (now - cls.EPOCH))
+                cls.lines += 1
+                try:
+                    logPath = cls.GetLogPath()
+                    os.makedirs(os.path.dirname(logPath), exist_ok=True)
+                    with open(logPath, 'a', encoding='utf-8') as file:
+                        file.write("{0:.0f}\t{1}\n".format(now, path))
+                    if cls.lines > max(cls.COMPACT_MIN, cls.COMPACT_FACTOR * len(cls.scores)):
+                        cls.Compact()
+                except OSError as e:
+                    print("Project: could not record usage; " + str(e))
+        sublime.set_timeout_async(record, 0)
+
+    @classmethod
+    def Compact(cls):
+        logPath = cls.GetLogPath()
+        temp = logPath + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as file:
+            for path, score in cls.scores.items():
+                file.write("={0!r}\t{1}\n".format(score, path))
+        os.replace(temp, logPath)
+        cls.lines = len(cls.scores)
+
+    # ----------------------------------------
+    # Most used first; projects never opened
+    # keep their listing order.
+    # ----------------------------------------
+    @classmethod
+    def Sort(cls, projects):
+        cls.Load()
+        with cls.lock:
+            scores = cls.scores
+            return sorted(projects, key=lambda project: -scores.get(project.path, -math.inf))
+
+
+# ====================================================
+# Directory Cache
+# Folder listings for the quick-panel browser, read
+# with os.scandir (no stat per entry) and validated by
+# the directory mtime. The most recently listed folders
+# are watched and kept current by events instead.
+# ====================================================
+class DirectoryCache:
+    PREFETCH_LIMIT = 32
+    WATCH_LIMIT = 256
+    entries = {}
+    watched = []
+    prefetchQueue = []
+    prefetchThread = None
+    lock = threading.Lock()
+
+    # ----------------------------------------
+    # Returns [(name, path, isDir)], folders
+    # first, sorted by name. A change made while
+    # the folder was being listed and watched
+    # moves its mtime: the listing is then not
+    # kept, the next call lists again.
+    # ----------------------------------------
+    @classmethod
+    def List(cls, dir):
+        with cls.lock:
+            entry = cls.entries.get(dir)
+            watched = dir in cls.watched
+        if entry is not None and watched and Watcher.Get().IsWatching(dir, cls.OnEvent):
+            return entry[1]
+        mtime = os.stat(dir).st_mtime_ns
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        items = []
+        with os.scandir(dir) as it:
+            for e in it:
+                try:
+                    isDir = e.is_dir()
+                except OSError:
+                    isDir = False
+                items.append((e.name, e.path, isDir))
+        cls.Sort(items)
+        with cls.lock:
+            cls.entries[dir] = (mtime, items)
+        cls.Watch(dir, (mtime, [item[0] for item in items]))
+        if os.stat(dir).st_mtime_ns != mtime:
+            with cls.lock:
+                cls.entries.pop(dir, None)
+        return items
+
+    @classmethod
+    def Sort(cls, items):
+        items.sort(key=lambda item: (not item[2], item[0].lower()))
+
+    @classmethod
+    def Watch(cls, dir, listing):
+        watcher = Watcher.Get()
+        with cls.lock:
+            if dir in cls.watched:
+                return
+            cls.watched.append(dir)
+            dropped = cls.watched[:-cls.WATCH_LIMIT]
+            del cls.watched[:-cls.WATCH_LIMIT]
+        for old in dropped:
+            watcher.Unwatch(old, cls.OnEvent)
+        try:
+            watcher.Watch(dir, cls.OnEvent, listing=listing)
+        except OSError:
+            with cls.lock:
+                if dir in cls.watched:
+                    cls.watched.remove(dir)
+
+    # ----------------------------------------
+    # Apply a watcher event to the listing.
+    # ----------------------------------------
+    @classmethod
+    def OnEvent(cls, event, path):
+        if event == RESET:
+            cls.Invalidate(path)
+            return
+        dir, name = os.path.split(path)
+        isDir = os.path.isdir(path) if event == ADDED else False
+        with cls.lock:
+            entry = cls.entries.get(dir)
+            if entry is None:
+                return
+            items = [item for item in entry[1] if item[0] != name]
+            if event == ADDED and os.path.lexists(path):
+                items.append((name, path, isDir))
+                cls.Sort(items)
+            cls.entries[dir] = (entry[0], items)
+
+    # ----------------------------------------
+    # Prefetch runs on its own thread, so it never
+    # delays listings on the async thread. The
+    # latest request goes first; the oldest ones
+    # fall off past the limit.
+    # ----------------------------------------
+    @classmethod
+    def Prefetch(cls, dirs):
+        with cls.lock:
+            queue = list(dirs) + [dir for dir in cls.prefetchQueue if dir not in dirs]
+            cls.prefetchQueue = queue[:cls.PREFETCH_LIMIT]
+            if cls.prefetchThread is None:
+                cls.prefetchThread = threading.Thread(target=cls.RunPrefetch, name='subl-utils-prefetch')
+                cls.prefetchThread.daemon = True
+                cls.prefetchThread.start()
+
+    # Drop queued prefetches: the user moved on.
+    @classmethod
+    def CancelPrefetch(cls):
+        with cls.lock:
+            cls.prefetchQueue = []
+
+    @classmethod
+    def RunPrefetch(cls):
+        while True:
+            with cls.lock:
+                if not cls.prefetchQueue:
+                    cls.prefetchThread = None
+                    return
+                dir = cls.prefetchQueue.pop(0)
+            try:
+                cls.List(dir)
+            except OSError:
+                pass
+
+    @classmethod
+    def Invalidate(cls, dir=None):
+        with cls.lock:
+            if dir is None:
+                cls.entries.clear()
+            else:
+                cls.entries.pop(dir, None)
+            if dir in cls.watched:
+                cls.watched.remove(dir)
+
 
 # ====================================================
 # Project Manager
@@ -126,79 +747,147 @@ class ProjectManager:
     # ----------------------------------------
     def __init__(self, window):
         self.window = window
-        self.projects = self.GetProjects()
+        self.projects = None
 
     # ----------------------------------------
     # Get projects from directory.
+    # Files that fail to load are skipped and
+    # reported in a summary.
     # ----------------------------------------
-    def GetProjects(self):
+    def GetProjects(self, parallel=False):
         dir = ProjectManager.PROJECTS_DIR
         projects = list()
+        errors = list()
         if os.path.exists(dir) and os.path.isdir(dir):
-            for filename in os.listdir(dir):
-                if filename.endswith(FILE_EXT):
-                    # try:
-                        path = os.path.join(dir, filename)
-                        project = Project.LoadFromPath(path)
-                        projects.append(project)
-                    # except:
-                        # print("Project: error " + path)
+            projects, errors = ProjectCache.GetProjects(dir, parallel)
         else:
             print("Project: directory not found; " + dir)
-        return projects
+        self.ReportLoadErrors(errors)
+        self.projects = ProjectUsage.Sort(projects)
+        return self.projects
+
+    def ReportLoadErrors(self, errors):
+        if len(errors) < 1:
+            return
+        for path, error in errors:
+            print("Project: could not load {0}; {1}".format(path, error))
+        msg = "Project: {0} project file(s) skipped, see console.".format(len(errors))
+        sublime.set_timeout(lambda: sublime.status_message(msg), 0)
+
+    # ----------------------------------------
+    # Load projects off the UI thread, then
+    # call onLoaded on the main thread.
+    # ----------------------------------------
+    def LoadProjectsAsync(self, onLoaded):
+        def load():
+            self.GetProjects(parallel=True)
+            sublime.set_timeout(onLoaded, 0)
+        sublime.set_timeout_async(load, 0)
 
     # ----------------------------------------
     # Select file or folder from opened folders.
+    # Browses every root folder: selecting a
+    # folder opens it, "./" selects the folder
+    # being browsed. onPromptDone gets a path.
     # ----------------------------------------
+    BROWSE_OPEN = 'open'
+    BROWSE_SELECT = 'select'
+
     def PromptSelectFileOrFolder(self, rootFolders, selectType, onPromptDone):
-        promptItems = []
+        self.browseRoots = list(rootFolders)
+        self.browseType = selectType
+        self.browseDone = onPromptDone
 
         folderCount = len(rootFolders)
         if folderCount < 1: 
             return
 
-        # if folderCount < 2:
-        rootPath = rootFolders[0]
-        folders = []
-        for name in os.listdir(rootPath):
-            path = os.path.join(rootPath, name)
-            if selectType == self.SELECT_DIR_ONLY and not os.path.isdir(path):
-                continue
-            if selectType == self.SELECT_FILE_ONLY and not os.path.isfile(path):
-                continue
-            folders.append(path)
-        # else:
-        # Prompt to select one of the top folders,
-        # then continue as we do here.
-
-        for path in folders:
-            branch, leaf = os.path.split(path)
-            item = [leaf, path]
-            promptItems.append(item)
-        
+        if folderCount < 2:
+            self.PromptBrowse(rootFolders[0])
+        else:
+            self.PromptBrowse(None)
+
+    def PromptBrowse(self, dir):
+        DirectoryCache.CancelPrefetch()
+        def load():
+            try:
+                items = self.GetBrowseItems(dir)
+            except OSError as e:
+                sublime.status_message("Project: cannot list {0}; {1}".format(dir, e))
+                return
+            sublime.set_timeout(lambda: self.PromptBrowse_Loaded(items), 0)
+        sublime.set_timeout_async(load, 0)
+
+    def GetBrowseItems(self, dir):
+        items = []
+        if dir is None:
+            labels = PathPresenter.Labels(self.browseRoots, os.sep)
+            for label, root in zip(labels, self.browseRoots):
+                items.append((label, PathPresenter.Detail(root), self.BROWSE_OPEN, root))
+            return items
+
+        if self.browseType != self.SELECT_FILE_ONLY:
+            items.append(("." + os.sep, PathPresenter.Detail(dir), self.BROWSE_SELECT, dir))
+        if dir not in self.browseRoots:
+            parent = os.path.dirname(dir)
+            items.append((".." + os.sep, PathPresenter.Detail(parent), self.BROWSE_OPEN, parent))
+        elif len(self.browseRoots) > 1:
+            items.append((".." + os.sep, "Root folders", self.BROWSE_OPEN, None))
+
+        for name, path, isDir in DirectoryCache.List(dir):
+            if isDir:
+                items.append((name + os.sep, PathPresenter.Detail(path), self.BROWSE_OPEN, path))
+            elif self.browseType != self.SELECT_DIR_ONLY:
+                items.append((name, PathPresenter.Detail(path), self.BROWSE_SELECT, path))
+        return items
+
+    def PromptBrowse_Loaded(self, items):
+        self.browseItems = items
+        promptItems = [[label, detail] for label, detail, action, path in items]
         if len(promptItems) < 1:
             promptItems.append(["None", "There's no opened folders."])
 
-        self.promptItems = promptItems
+        # Warm the cache for the next level.
+        DirectoryCache.Prefetch([path for label, detail, action, path in items
+            if action == self.BROWSE_OPEN and path is not None])
+
         flags = sublime.MONOSPACE_FONT
         selectedIndex = 0
-        onItemHighlighted = None
         self.window.show_quick_panel(
             promptItems,
-            onPromptDone,
+            self.PromptBrowseDone,
             flags,
             selectedIndex,
-            onItemHighlighted
+            self.PromptBrowseHighlighted
             )
 
+    def PromptBrowseHighlighted(self, index):
+        if 0 <= index < len(self.browseItems):
+            label, detail, action, path = self.browseItems[index]
+            if action == self.BROWSE_OPEN and path is not None:
+                DirectoryCache.Prefetch([path])
+
+    def PromptBrowseDone(self, index):
+        if index < 0 or index >= len(self.browseItems):
+            return
+        label, detail, action, path = self.browseItems[index]
+        if action == self.BROWSE_OPEN:
+            self.PromptBrowse(path)
+        else:
+            self.browseDone(path)
+
     # ----------------------------------------
     # Select project from saved projects.
     # ----------------------------------------
     def PromptSelectProject(self, onPromptDone):
+        self.LoadProjectsAsync(lambda: self.PromptSelectProject_Loaded(onPromptDone))
+
+    def PromptSelectProject_Loaded(self, onPromptDone):
         promptItems = []
         for project in self.projects:
             item = [project.name]
-            item.append(next(iter(project.GetFolders()), "Empty"))
+            folders = project.GetFolders()
+            item.append(PathPresenter.Detail(folders[0]) if len(folders) > 0 else "Empty")
             # The command show_quick_panel is bugged.
             # It is best to have two lines per item (lists of 2).
             promptItems.append(item)
@@ -232,14 +921,11 @@ class ProjectManager:
             self.PromptSelectFileOrFolder(project.GetFolders(), self.SELECT_BOTH, self.PromptOpenFromProject_SelectFolderDone)
         return
 
-    def PromptOpenFromProject_SelectFolderDone(self, index):
-        if index >= 0:
-            item = self.promptItems[index]
-            path = item[1]
-            if os.path.isdir(path):
-                self.OpenProjectFromPath(item[1])
-            else:
-                self.window.open_file(path)
+    def PromptOpenFromProject_SelectFolderDone(self, path):
+        if os.path.isdir(path):
+            self.OpenProjectFromPath(path)
+        else:
+            self.window.open_file(path)
 
 
     # ----------------------------------------
@@ -249,10 +935,8 @@ class ProjectManager:
         folders = self.window.folders()
         self.PromptSelectFileOrFolder(folders, self.SELECT_DIR_ONLY, self.PromptScopeToDone)
 
-    def PromptScopeToDone(self, index):
-        if index >= 0:
-            item = self.promptItems[index]
-            self.OpenProjectFromPath(item[1])
+    def PromptScopeToDone(self, path):
+        self.OpenProjectFromPath(path)
 
     # ----------------------------------------
     # Open project from saved projects.
@@ -321,6 +1005,144 @@ class ProjectManager:
         project.Rename(newName)
         self.SaveProject();
 
+    # ----------------------------------------
+    # Remove folder from opened folders
+    # ----------------------------------------
+    def PromptRemoveFolder(self):
+        self.folders = FolderSet(self.window.project_data()).GetPaths()
+        if len(self.folders) < 1:
+            sublime.status_message("Project: there are no folders to remove.")
+            return
+        labels = PathPresenter.Labels(self.folders)
+        promptItems = [[label, PathPresenter.Detail(path)] for label, path in zip(labels, self.folders)]
+        self.window.show_quick_panel(
+            promptItems,
+            self.PromptRemoveFolderDone,
+            sublime.MONOSPACE_FONT,
+            0,
+            None
+            )
+
+    def PromptRemoveFolderDone(self, index):
+        if index >= 0:
+            self.RemoveFolders([self.folders[index]])
+
+    # ----------------------------------------
+    # Add folders of a saved project to opened folders
+    # ----------------------------------------
+    def PromptAppend(self):
+        self.PromptSelectProject(self.PromptAppendDone)
+
+    def PromptAppendDone(self, index):
+        projects = self.projects
+        if (index >= 0 and projects != None and len(projects) > 0):
+            self.AppendProject(projects[index])
+
+    # ----------------------------------------
+    # Bulk folder operations.
+    # All changes are applied with a single
+    # set_project_data call, none if nothing
+    # changed. Returns (added, removed).
+    # ----------------------------------------
+    def UpdateFolders(self, add=(), remove=(), append=()):
+        folders = FolderSet(self.window.project_data())
+        removed = folders.Remove(remove)
+        added = folders.Add(add) + folders.Append(append)
+        if folders.changed:
+            self.window.set_project_data(folders.GetData())
+        return added, removed
+
+    def AddFolders(self, paths):
+        return self.UpdateFolders(add=paths)[0]
+
+    def RemoveFolders(self, paths):
+        removed = self.UpdateFolders(remove=paths)[1]
+        sublime.status_message("Project: {0} folder(s) removed.".format(removed))
+        return removed
+
+    def AppendProject(self, project):
+        added = self.UpdateFolders(append=project.data.get(KEY_FOLDERS, []))[0]
+        sublime.status_message("Project: {0} folder(s) added from {1}.".format(added, project.name))
+        return added
+
+    # ----------------------------------------
+    # Reload the opened project from its file.
+    # Only what differs from the window's data
+    # is applied: unchanged folder entries are
+    # kept as they are, and nothing is set when
+    # nothing changed.
+    # ----------------------------------------
+    def ReloadProject(self):
+        project = self.GetActiveProject()
+        path = project.path if project is not None else None
+        if not path:
+            path = self.window.project_file_name()
+        if not path or not os.path.exists(path):
+            sublime.status_message("Project: no project file to reload.")
+            return
+
+        # Loaded as when the project was opened,
+        # so an unchanged file diffs to nothing.
+        name = Project.GetNameFromPath(path)
+        try:
+            loaded = Project.LoadFromPath(path).data
+            current = self.window.project_data() or {}
+            data, changes = self.DiffProjectData(current, loaded)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            sublime.status_message("Project: could not reload {0}; {1}".format(path, e))
+            return
+
+        if project is not None:
+            project.data = data
+        if len(changes) < 1:
+            sublime.status_message("Project: {0} is up to date.".format(name))
+            return
+        self.window.set_project_data(data)
+        msg = "Project: {0} reloaded ({1}).".format(name, ", ".join(changes))
+        sublime.status_message(msg)
+        print(msg)
+
+    # Returns the data to apply, reusing current
+    # folder entries that did not change, and a
+    # list describing the changes.
+    def DiffProjectData(self, current, new):
+        folders = FolderSet(current)
+        blocks = []
+        added = 0
+        changed = 0
+        seen = set()
+        for block in new.get(KEY_FOLDERS, []):
+            key = FolderSet.Normalize(block[KEY_PATH])
+            if key in seen:
+                continue
+            seen.add(key)
+            old = folders.index.get(key)
+            if old is None:
+                added += 1
+                blocks.append(block)
+            elif (dict(old, **{KEY_PATH: key}) != dict(block, **{KEY_PATH: key})):
+                changed += 1
+                blocks.append(block)
+            else:
+                blocks.append(old)
+        removed = len([key for key in folders.index if key not in seen])
+        moved = (added, removed, changed) == (0, 0, 0) and blocks != folders.blocks
+
+        data = dict(new)
+        data[KEY_FOLDERS] = blocks
+        changes = []
+        for count, label in ((added, "added"), (removed, "removed"), (changed, "changed")):
+            if count > 0:
+                changes.append("{0} folder(s) {1}".format(count, label))
+        if moved:
+            changes.append("folders reordered")
+        keys = set(current) | set(new)
+        keys.discard(KEY_FOLDERS)
+        for key in sorted(keys):
+            if current.get(key) != new.get(key):
+                changes.append("{0} changed".format(key))
+        return data, changes
+
     # ----------------------------------------
     # Public
     # ----------------------------------------
@@ -333,6 +1155,8 @@ class ProjectManager:
     def OpenProject(self, project):
         self.window.set_project_data(project.data)
         self.window.active_project = project
+        if project.path:
+            ProjectUsage.Record(project.path)
         msg = "Project: {0} opened.".format(project.name)
         sublime.status_message(msg)
         print(msg)
@@ -375,11 +1199,7 @@ class ProjectManager:
         self.window.active_project = project
 
     def SaveProject(self):
-        try:
-            os.makedirs(ProjectManager.PROJECTS_DIR)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise
+        os.makedirs(ProjectManager.PROJECTS_DIR, exist_ok=True)
 
         project = self.GetActiveProject()
         canSave = (
@@ -416,6 +1236,7 @@ class ProjectManager:
 # ====================================================
 # Commands
 # ====================================================
+@timed
 class ProjectRenameCommand(sublime_plugin.WindowCommand):
     def run(self):
         ProjectManager(self.window).PromptRename()
@@ -424,6 +1245,7 @@ class ProjectRenameCommand(sublime_plugin.WindowCommand):
 # PaletteCommand:
 # Open parent folder of first opened folder
 # ----------------------------------------
+@timed
 class ProjectOpenParentFolderAsProject(sublime_plugin.WindowCommand):
     def run(self):
         ProjectManager(self.window).OpenParentFolder()
@@ -432,6 +1254,7 @@ class ProjectOpenParentFolderAsProject(sublime_plugin.WindowCommand):
 # PaletteCommand:
 # Open folder as root or file from saved projects
 # ----------------------------------------
+@timed
 class ProjectOpenFromProjectCommand(sublime_plugin.WindowCommand):
     def run(self):
         ProjectManager(self.window).PromptOpenFromProject()
@@ -440,6 +1263,7 @@ class ProjectOpenFromProjectCommand(sublime_plugin.WindowCommand):
 # SideBarCommand:
 # Open selected as root
 # ----------------------------------------
+@timed
 class ProjectOpenFromPathCommand(sublime_plugin.WindowCommand):
     def run(self, paths):
         if len(paths) < 1: 
@@ -456,10 +1280,41 @@ class ProjectOpenFromPathCommand(sublime_plugin.WindowCommand):
                 return True
         return False
 
+# ----------------------------------------
+# PaletteCommand:
+# Apply changes made to the opened project's file
+# ----------------------------------------
+@timed
+class ProjectReloadCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        ProjectManager(self.window).ReloadProject()
+
+# ----------------------------------------
+# PaletteCommand:
+# Remove folders from opened folders
+# ----------------------------------------
+@timed
+class ProjectRemoveFolderCommand(sublime_plugin.WindowCommand):
+    def run(self, paths=None):
+        if paths:
+            ProjectManager(self.window).RemoveFolders(paths)
+        else:
+            ProjectManager(self.window).PromptRemoveFolder()
+
+# ----------------------------------------
+# PaletteCommand:
+# Add all folders of a saved project to opened folders
+# ----------------------------------------
+@timed
+class ProjectAppendCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        ProjectManager(self.window).PromptAppend()
+
 # ----------------------------------------
 # PaletteCommand:
 # Open as root a folder from opened folders
 # ----------------------------------------
+@timed
 class ProjectScopeToCommand(sublime_plugin.WindowCommand):
     def run(self):
         ProjectManager(self.window).PromptScopeTo()
@@ -468,6 +1323,7 @@ class ProjectScopeToCommand(sublime_plugin.WindowCommand):
 # PaletteCommand:
 # Open as root a project from saved projects
 # ----------------------------------------
+@timed
 class ProjectOpenCommand(sublime_plugin.WindowCommand):
     def run(self):
         ProjectManager(self.window).PromptOpen()
@@ -476,6 +1332,7 @@ class ProjectOpenCommand(sublime_plugin.WindowCommand):
 # PaletteCommand:
 # Save opened folders as project
 # ----------------------------------------
+@timed
 class ProjectSaveCommand(sublime_plugin.WindowCommand):
     def run(self):
         ProjectManager(self.window).SaveProject()
@@ -484,6 +1341,7 @@ class ProjectSaveCommand(sublime_plugin.WindowCommand):
 # PaletteCommand:
 # Remove project from saved projects
 # ----------------------------------------
+@timed
 class ProjectRemoveCommand(sublime_plugin.WindowCommand):
     def run(self):
         ProjectManager(self.window).PromptRemove()
@@ -492,6 +1350,7 @@ class ProjectRemoveCommand(sublime_plugin.WindowCommand):
 # PaletteCommand:
 # Close opened folders
 # ----------------------------------------
+@timed
 class ProjectCloseCommand(sublime_plugin.WindowCommand):
     def run(self):
         ProjectManager(self.window).CloseProject()
@@ -500,13 +1359,36 @@ class ProjectCloseCommand(sublime_plugin.WindowCommand):
 # PaletteCommand:
 # Open .sublime-project of opened project
 # ----------------------------------------
+@timed
 class ProjectEditCommand(sublime_plugin.WindowCommand):
     def run(self):
         ProjectManager(self.window).EditProject()
 
+# ----------------------------------------
+# PaletteCommand:
+# Check that filesystem events arrive, and how fast
+# ----------------------------------------
+@timed
+class ProjectWatcherSelfTestCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        def test():
+            classes = [type(Watcher.Get())]
+            if classes[0] is not PollWatcher:
+                classes.append(PollWatcher)
+            results = [SelfTest(watcherClass) for watcherClass in classes]
+            print("==========================")
+            for ok, report in results:
+                print(report)
+            print("==========================")
+            passed = all(ok for ok, report in results)
+            sublime.status_message("Project: watcher self-test {0}, see console.".format("passed" if passed else "FAILED"))
+        sublime.status_message("Project: watcher self-test running...")
+        sublime.set_timeout_async(test, 0)
+
 # ----------------------------------------
 # Print information for debugging
 # ----------------------------------------   
+@timed
 class ProjectDebugCommand(sublime_plugin.WindowCommand):     
     def run(self):
         project = ProjectManager(self.window).GetActiveProject()
@@ -523,3 +1405,5 @@ class ProjectDebugCommand(sublime_plugin.WindowCommand):
         print("Plugin ProjectName: " + str(plugProjectName))
         print("Plugin ProjectPath: " + str(plugProjectPath))
         print("==========================")
+
+Metrics.StopLoad(__name__, LOAD_START)
@@ -1,6 +1,85 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
 import sublime
 import sublime_plugin
 import os
+import threading
+import time
+
+from .projects import ProjectCache, ProjectManager
+
+# -------------------------------------------------------
+# Project root of a directory: the nearest directory,
+# itself or above, holding a marker file or saved in a
+# project's folders. The upward walks are cached in a
+# trie of directories: each directory is checked for
+# markers once, later lookups in the tree cost no stat.
+# Markers added or removed outside the editor are seen
+# once the trie expires, after MAX_AGE seconds; saving
+# a marker file from the editor resets it at once.
+# -------------------------------------------------------
+class RootNode(object):
+	__slots__ = ('children', 'marked')
+
+	def __init__(self):
+		self.children = {}
+		self.marked = None
+
+class RootFinder(object):
+	MARKERS = ('.git', 'pyproject.toml')
+	MAX_AGE = 300
+	trie = RootNode()
+	built = time.monotonic()
+	lock = threading.Lock()
+
+	@classmethod
+	def Find(cls, dir):
+		dir = os.path.normpath(dir)
+		key = os.path.normcase(dir)
+		parts = key.split(os.sep)
+		with cls.lock:
+			if time.monotonic() - cls.built > cls.MAX_AGE:
+				cls.trie = RootNode()
+				cls.built = time.monotonic()
+			nodes = []
+			node = cls.trie
+			for part in parts:
+				child = node.children.get(part)
+				if child is None:
+					child = RootNode()
+					node.children[part] = child
+				node = child
+				nodes.append(node)
+
+		projectFolders = cls.GetProjectFolders()
+		dirParts = dir.split(os.sep)
+		for depth in range(len(nodes), 0, -1):
+			node = nodes[depth - 1]
+			path = os.sep.join(dirParts[:depth])
+			if not path or path.endswith(':'):
+				path += os.sep
+			if node.marked is None:
+				node.marked = any(os.path.exists(os.path.join(path, marker)) for marker in cls.MARKERS)
+			if node.marked or os.sep.join(parts[:depth]) in projectFolders:
+				return path
+		return None
+
+	# Folders of the saved projects; listing the
+	# projects once is enough, they are watched.
+	@classmethod
+	def GetProjectFolders(cls):
+		projectsDir = ProjectManager.PROJECTS_DIR
+		if projectsDir and not ProjectCache.IsTrusted(projectsDir) and os.path.isdir(projectsDir):
+			ProjectCache.GetProjects(projectsDir)
+		return ProjectCache.GetFolderSet()
+
+	@classmethod
+	def Invalidate(cls):
+		with cls.lock:
+			cls.trie = RootNode()
+			cls.built = time.monotonic()
+
 
 # -------------------------------------------------------
 # On PluginLoaded, SaveDirectory = UserProfile
@@ -12,13 +91,21 @@ import os
 # 		view.settings().set('default_dir', dir)
 
 # -------------------------------------------------------
-# On NewBuffer, SaveDirectory = OpenedFolder
+# On NewBuffer, SaveDirectory = ProjectRoot of the last
+# file saved in the window, or its first OpenedFolder
 # -------------------------------------------------------
-# class NewFileListener(sublime_plugin.EventListener):
-#     def on_new_async(self, view):
-#         if view.window() and view.window().folders():
-#         	dir = view.window().folders()[0]
-#         	view.settings().set('default_dir', dir)
+@timed
+class NewFileListener(sublime_plugin.EventListener):
+	def on_new_async(self, view):
+		window = view.window()
+		if window is None:
+			return
+		dir = PostSaveFileListener.lastRoots.get(window.id())
+		if dir is None and window.folders():
+			dir = window.folders()[0]
+			dir = RootFinder.Find(dir) or dir
+		if dir is not None:
+			view.settings().set('default_dir', dir)
 
 # -------------------------------------------------------
 # On FileLoaded, SaveDirectory = FileDirectory
@@ -29,13 +116,25 @@ import os
 # 		view.settings().set('default_dir', dir)
 
 # -------------------------------------------------------
-# On FileSaved, SaveDirectory = FileDirectory
+# On FileSaved, SaveDirectory = ProjectRoot, or
+# FileDirectory outside of any project
 # -------------------------------------------------------
+@timed
 class PostSaveFileListener(sublime_plugin.EventListener):
-	def on_post_save(self, view):
+	lastRoots = {}
+
+	def on_post_save_async(self, view):
 		dir = os.path.dirname(view.file_name())
+		if os.path.basename(view.file_name()) in RootFinder.MARKERS:
+			RootFinder.Invalidate()
 		if dir != None and dir != "":
+			root = RootFinder.Find(dir)
+			if root is not None:
+				dir = root
 			view.settings().set('default_dir', dir)
+			window = view.window()
+			if window is not None:
+				PostSaveFileListener.lastRoots[window.id()] = dir
 
 # -------------------------------------------------------
 # On NewWindow, SaveDirectory = UserProfile
@@ -52,3 +151,4 @@ class PostSaveFileListener(sublime_plugin.EventListener):
 # 			view.settings().set('default_dir', '%USERPROFILE%')
 # 			windowCount = newCount
 
+Metrics.StopLoad(__name__, LOAD_START)
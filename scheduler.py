@@ -0,0 +1,65 @@
+from .perf import Metrics, timedMethod
+LOAD_START = Metrics.StartLoad()
+
+import sublime
+import functools
+import itertools
+import threading
+
+
+# ====================================================
+# Scheduler
+# Merges bursts of work per view: scheduling the same
+# key again before the delay is over replaces the
+# pending run, so only the last one happens, once the
+# view has been quiet for the delay. Runs for views
+# that were closed in the meantime are dropped.
+# ====================================================
+class Scheduler:
+    generations = {}
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    @classmethod
+    def Schedule(cls, view, key, delay, callback):
+        token = (view.id(), key)
+        with cls.lock:
+            generation = next(cls.counter)
+            cls.generations[token] = generation
+
+        def run():
+            with cls.lock:
+                if cls.generations.get(token) != generation:
+                    return
+                del cls.generations[token]
+            if view.is_valid():
+                callback()
+        sublime.set_timeout_async(run, delay)
+
+    @classmethod
+    def Cancel(cls, view, key):
+        with cls.lock:
+            cls.generations.pop((view.id(), key), None)
+
+
+# ----------------------------------------
+# Decorator for event listener methods taking
+# the view first: on_modified_async(self, view).
+# The method runs on the async thread, after
+# delay ms without another event for the view.
+# method.cancel(view) drops a pending run.
+# ----------------------------------------
+def debounced(delay):
+    def decorate(method):
+        module = method.__module__.rsplit('.', 1)[-1]
+        key = method.__qualname__
+        work = timedMethod(method, "{0}.{1} (debounced)".format(module, key))
+
+        @functools.wraps(method)
+        def wrapper(self, view, *args):
+            Scheduler.Schedule(view, key, delay, lambda: work(self, view, *args))
+        wrapper.cancel = lambda view: Scheduler.Cancel(view, key)
+        return wrapper
+    return decorate
+
+Metrics.StopLoad(__name__, LOAD_START)
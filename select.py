@@ -1,10 +1,134 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
 import sublime
 import sublime_plugin
 
 
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Interval sets
+# Sorted lists of disjoint, non-touching (begin, end)
+# pairs. Every operation is one merge-like pass over
+# its inputs, so thousands of folds cost little.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Sort and merge regions (or pairs) that overlap
+# or touch. Empty regions are dropped.
+def toSpans(regions):
+	pairs = sorted((r.begin(), r.end()) if isinstance(r, sublime.Region) else (min(r), max(r)) for r in regions)
+	spans = []
+	for begin, end in pairs:
+		if begin == end:
+			continue
+		if spans and begin <= spans[-1][1]:
+			if end > spans[-1][1]:
+				spans[-1] = (spans[-1][0], end)
+		else:
+			spans.append((begin, end))
+	return spans
+
+def toRegions(spans):
+	return [sublime.Region(begin, end) for begin, end in spans]
+
+def union(a, b):
+	spans = []
+	i = j = 0
+	while i < len(a) or j < len(b):
+		if j >= len(b) or (i < len(a) and a[i][0] <= b[j][0]):
+			begin, end = a[i]
+			i += 1
+		else:
+			begin, end = b[j]
+			j += 1
+		if spans and begin <= spans[-1][1]:
+			if end > spans[-1][1]:
+				spans[-1] = (spans[-1][0], end)
+		else:
+			spans.append((begin, end))
+	return spans
+
+def intersection(a, b):
+	spans = []
+	i = j = 0
+	while i < len(a) and j < len(b):
+		begin = max(a[i][0], b[j][0])
+		end = min(a[i][1], b[j][1])
+		if begin < end:
+			spans.append((begin, end))
+		# Drop whichever ends first, the other
+		# may still overlap the next one.
+		if a[i][1] < b[j][1]:
+			i += 1
+		else:
+			j += 1
+	return spans
+
+def difference(a, b):
+	spans = []
+	j = 0
+	for begin, end in a:
+		while j < len(b) and b[j][1] <= begin:
+			j += 1
+		k = j
+		while k < len(b) and b[k][0] < end:
+			if b[k][0] > begin:
+				spans.append((begin, b[k][0]))
+			begin = max(begin, b[k][1])
+			k += 1
+		if begin < end:
+			spans.append((begin, end))
+	return spans
+
+# What a does not cover between begin and end.
+def complement(a, begin, end):
+	return difference([(begin, end)], a) if begin < end else []
+
+def replaceSelection(view, spans):
+	view.sel().clear()
+	view.sel().add_all(toRegions(spans))
+
+
+@timed
 class SelectAllExceptFoldedCommand(sublime_plugin.TextCommand):
 	def run(self, edit):
-		folded_regions = self.view.folded_regions()
-		self.view.sel().clear()
-		self.view.sel().add_all(folded_regions)
-		self.view.run_command('invert_selection')
\ No newline at end of file
+		folded_spans = toSpans(self.view.folded_regions())
+		replaceSelection(self.view, complement(folded_spans, 0, self.view.size()))
+
+@timed
+class SelectFoldedCommand(sublime_plugin.TextCommand):
+	def run(self, edit):
+		replaceSelection(self.view, toSpans(self.view.folded_regions()))
+
+	def is_enabled(self):
+		return len(self.view.folded_regions()) > 0
+
+# One selection per line of folded text,
+# without the line breaks.
+@timed
+class SelectLinesWithinFoldsCommand(sublime_plugin.TextCommand):
+	def run(self, edit):
+		view = self.view
+		folded_spans = toSpans(view.folded_regions())
+		line_spans = []
+		for begin, end in folded_spans:
+			line_spans.extend((max(begin, line.begin()), min(end, line.end())) for line in view.lines(sublime.Region(begin, end)))
+		# Lines are kept apart: no merging here.
+		replaceSelection(view, [span for span in line_spans if span[0] < span[1]])
+
+	def is_enabled(self):
+		return len(self.view.folded_regions()) > 0
+
+@timed
+class IntersectSelectionWithFoldsCommand(sublime_plugin.TextCommand):
+	def run(self, edit):
+		view = self.view
+		spans = intersection(toSpans(view.sel()), toSpans(view.folded_regions()))
+		if not spans:
+			sublime.status_message("Selection: nothing folded in the selection.")
+			return
+		replaceSelection(view, spans)
+
+	def is_enabled(self):
+		return len(self.view.folded_regions()) > 0
+
+Metrics.StopLoad(__name__, LOAD_START)
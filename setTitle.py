@@ -1,31 +1,103 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
 import sublime
 import sublime_plugin
 import re
 
+from .scheduler import debounced
+
+# An ATX heading (# Title #) or a setext underline
+# (=== or --- under the title line).
+HEADING_REGEX = re.compile(r'^(?:(#{1,6})(?!#)(.*)|(?:-{3,}|={3,})[ \t]*$)', re.M)
+
+
+# ----------------------------------------
+# Headings in text, as (begin, end, level, title):
+# begin is where the heading's first line starts
+# and end where its last line ends. text must
+# start at a line start; offset is added to
+# positions. Empty headings are skipped, and so
+# are underlines with no title line above them.
+# ----------------------------------------
+def iterHeadings(text, offset=0):
+    for m in HEADING_REGEX.finditer(text):
+        if m.group(1) is not None:
+            title = m.group(2)
+            if title.endswith(m.group(1)):
+                title = title[:-len(m.group(1))]
+            begin = m.start()
+            level = len(m.group(1))
+        else:
+            # Underline: the title is the line above.
+            if m.start() == 0:
+                continue
+            begin = text.rfind('\n', 0, m.start() - 1) + 1
+            title = text[begin:m.start() - 1]
+            if HEADING_REGEX.match(title):
+                continue
+            level = 1 if text[m.start()] == '=' else 2
+        title = title.strip()
+        if len(title) > 0:
+            yield (begin + offset, m.end() + offset, level, title)
+
+# First heading in text, as (title, end);
+# text after end cannot change the title.
+def findTitle(text):
+    for begin, end, level, title in iterHeadings(text):
+        return title, end
+    return None, len(text)
+
 
+@timed
 class SetTitleOnMarkdownViewEvent(sublime_plugin.EventListener):
+    # Only a heading within this many characters
+    # from the top names the view.
+    PREFIX_SIZE = 64 * 1024
+    # view id -> (change count, text the title depends on, title)
+    cache = {}
+
+    @debounced(250)
     def on_modified_async(self, view):
         syntax = view.settings().get('syntax')
-        if syntax and 'Markdown' in syntax:
-            text = view.substr(sublime.Region(0, view.size()))
-            it = re.finditer(r'^(#{1,6}(?!#))|^(-{3,}|={3,})', text, re.M)
-            title = ''
-            for m in it:
-                if re.match(r'^(-{3,}|={3,})$', m.group()):
-                    title_end = m.start() - 1
-                    title_begin = text.rfind('\n', 0, title_end) + 1
-                    title = text[title_begin: title_end]
-                else:
-                    title_begin = m.end()
-                    title_end = re.search('(' + m.group() + ')?(\n|$)', text[title_begin:]).start() + title_begin
-                    title = text[title_begin: title_end]
-                break
-            if len(title) == 0:
-                firstLineEnd = text.find('\n')
-                if firstLineEnd == -1:
-                    firstLineEnd = len(text)
-                title = text[0: firstLineEnd]
-
-            title = title.strip()
-            if view.file_name() is None and len(title) > 0:
-                view.set_name(title[:55])
\ No newline at end of file
+        if not syntax or 'Markdown' not in syntax or view.file_name() is not None:
+            return
+        changeCount = view.change_count()
+        cached = SetTitleOnMarkdownViewEvent.cache.get(view.id())
+        if cached is not None:
+            if cached[0] == changeCount:
+                return
+            # Edits past the title's last line
+            # leave this text as it was.
+            depends = cached[1]
+            if depends is not None and view.substr(sublime.Region(0, len(depends))) == depends:
+                SetTitleOnMarkdownViewEvent.cache[view.id()] = (changeCount, depends, cached[2])
+                return
+
+        text = view.substr(sublime.Region(0, min(view.size(), self.PREFIX_SIZE)))
+        title, end = findTitle(text)
+        if title is None:
+            firstLineEnd = text.find('\n')
+            if firstLineEnd == -1:
+                firstLineEnd = len(text)
+            title = text[0: firstLineEnd].strip()
+        # Include the newline ending the title, so
+        # typing at the end of its line is seen.
+        if end < len(text):
+            end += 1
+        depends = text[:end]
+        if end == len(text) and len(text) < self.PREFIX_SIZE:
+            # Typing at the end of the buffer extends
+            # the title: check again on every change.
+            depends = None
+        SetTitleOnMarkdownViewEvent.cache[view.id()] = (changeCount, depends, title)
+
+        name = title[:55]
+        if len(name) > 0 and view.name() != name:
+            view.set_name(name)
+
+    def on_close(self, view):
+        self.on_modified_async.cancel(view)
+        SetTitleOnMarkdownViewEvent.cache.pop(view.id(), None)
+
+Metrics.StopLoad(__name__, LOAD_START)
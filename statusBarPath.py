@@ -1,51 +1,66 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
 import os
-import os.path
 import sublime
 import sublime_plugin
 
+from .gitRepo import GitRepo
+from .paths import PathPresenter
+from .scheduler import debounced
+
 
+@timed
 class CurrentPathStatusCommand(sublime_plugin.EventListener):
+    MAX_DIRS = 3
 
+    @debounced(100)
     def on_activated(self, view):
         path = view.file_name()
         if path != None and path != "":
-            maxDirs = 3
-            path = self.shortenPath(path, maxDirs)
-            view.set_status('zPath', path)
+            window = view.window()
+            others = [v.file_name() for v in window.views()] if window is not None else []
+            path = PathPresenter.ShortenAmong(path, [other for other in others if other], self.MAX_DIRS)
+            PathPresenter.SetStatus(view, 'zPath', path)
+            self.UpdateGitStatus(view)
+
+    # Saving a tracked file makes the repository
+    # dirty; untracked files do not count.
+    def on_post_save_async(self, view):
+        path = view.file_name()
+        repo = GitRepo.Find(os.path.dirname(path)) if path else None
+        if repo is not None and repo.MarkSaved(path):
+            self.RefreshGitStatus(view)
+
+    def on_close(self, view):
+        self.on_activated.cancel(view)
+        self.RefreshGitStatus.cancel(view)
+        PathPresenter.Forget(view)
+
+    @debounced(250)
+    def RefreshGitStatus(self, view):
+        self.UpdateGitStatus(view)
 
     # --------------------------------
-    # Shorten path by hidding directories,
-    # exluding the root. 
+    # "repo [branch*↕]": * when tracked files
+    # changed, ↕ when the branch and its
+    # upstream point to different commits.
+    # Until the dirty check is done, the
+    # status is shown without *, and shown
+    # again once it is.
     # --------------------------------
-    def shortenPath(self, path, maxDirs):
-        path = os.path.normpath(path)
-        parts = list(filter(None, path.split(os.sep)))
-        # ---
-        partsCount = len(parts)
-
-        dirCount = partsCount - 1 # Minus fileName.
-        if dirCount < maxDirs:
-            return path;
-
-        # Add filename
-        shortenedPath = parts[partsCount - 1] 
-
-        # Add directories
-        for i in range(dirCount):
-            if i == 0: 
-                continue;
-            if i > maxDirs:
-                break;
-            name = parts[partsCount - 1 - i];
-            shortenedPath = name + os.sep + shortenedPath
-        
-        # Add "..." if necessary
-        hiddenDirs = dirCount - maxDirs
-        if hiddenDirs > 0:
-            shortenedPath = '...' + os.sep + shortenedPath
-        
-        # Add root
-        shortenedPath = parts[0] + os.sep + shortenedPath
-        if path.startswith('\\\\'):
-            shortenedPath = '\\\\' + shortenedPath
-        return shortenedPath
\ No newline at end of file
+    def UpdateGitStatus(self, view):
+        path = view.file_name()
+        repo = GitRepo.Find(os.path.dirname(path)) if path else None
+        if repo is None:
+            PathPresenter.SetStatus(view, 'zPathGit', None)
+            return
+        flags = ''
+        if repo.GetDirty(lambda: self.RefreshGitStatus(view)):
+            flags += '*'
+        if repo.IsOutOfSync():
+            flags += '↕'
+        status = "{0} [{1}{2}]".format(repo.name, repo.GetBranch(), flags)
+        PathPresenter.SetStatus(view, 'zPathGit', status)
+
+Metrics.StopLoad(__name__, LOAD_START)
@@ -0,0 +1,410 @@
+import os
+import struct
+import sys
+import threading
+import time
+
+ADDED = 'add'
+MODIFIED = 'modify'
+DELETED = 'delete'
+RESET = 'reset'
+
+
+# ====================================================
+# Watcher
+# Watches single directories (not recursive) and calls
+# callback(event, path) from its own thread. Uses inotify
+# on Linux and falls back to polling mtimes elsewhere.
+# A RESET event means events were lost or the directory
+# went away: the consumer should scan again.
+# ====================================================
+class Watcher:
+    instance = None
+    lock = threading.Lock()
+
+    # --------------------------------
+    # Class
+    # --------------------------------
+    @classmethod
+    def Get(cls):
+        with cls.lock:
+            if cls.instance is None:
+                cls.instance = cls.Create()
+                cls.instance.Start()
+            return cls.instance
+
+    @classmethod
+    def Create(cls):
+        if sys.platform.startswith('linux'):
+            try:
+                return InotifyWatcher()
+            except OSError as e:
+                print("Watcher: inotify unavailable, polling; " + str(e))
+        return PollWatcher()
+
+    @classmethod
+    def Shutdown(cls):
+        with cls.lock:
+            if cls.instance is not None:
+                cls.instance.Stop()
+                cls.instance = None
+
+    # --------------------------------
+    # Constructor
+    # --------------------------------
+    def __init__(self):
+        self.watches = {}
+        self.watchLock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    # --------------------------------
+    # Public
+    # --------------------------------
+    # Several callbacks can watch the same directory.
+    # contents: also report files modified in place,
+    # not only entries added or removed.
+    # listing: (mtime, names) of the directory as the
+    # caller just read it, so polling need not list
+    # it again.
+    def Watch(self, dir, callback, contents=False, listing=None):
+        with self.watchLock:
+            subscribers = dict(self.watches.get(dir, {}))
+            subscribers[callback] = contents
+        self.Apply(dir, subscribers, listing)
+
+    def Unwatch(self, dir, callback=None):
+        with self.watchLock:
+            subscribers = dict(self.watches.get(dir, {}))
+            if callback is None:
+                subscribers.clear()
+            else:
+                subscribers.pop(callback, None)
+        self.Apply(dir, subscribers, None)
+
+    def IsWatching(self, dir, callback=None):
+        with self.watchLock:
+            subscribers = self.watches.get(dir)
+            return subscribers is not None and (callback is None or callback in subscribers)
+
+    # Report changes now rather than at the next
+    # check; only the poll watcher needs it.
+    def Refresh(self, dir):
+        pass
+
+    def Start(self):
+        self.thread = threading.Thread(target=self.Run, name='subl-utils-watcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def Stop(self):
+        self.stopped.set()
+
+    # --------------------------------
+    # Private
+    # --------------------------------
+    def Apply(self, dir, subscribers, listing):
+        raise NotImplementedError()
+
+    def Run(self):
+        raise NotImplementedError()
+
+    def Notify(self, dir, event, path):
+        with self.watchLock:
+            subscribers = list(self.watches.get(dir, {}).items())
+            if event == RESET:
+                self.watches.pop(dir, None)
+        for callback, contents in subscribers:
+            if event == MODIFIED and not contents:
+                continue
+            try:
+                callback(event, path)
+            except Exception as e:
+                print("Watcher: callback failed for {0} {1}; {2}".format(event, path, e))
+
+
+# ====================================================
+# Inotify Watcher (Linux)
+# ====================================================
+class InotifyWatcher(Watcher):
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    MASK_ENTRIES = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    MASK_CONTENTS = MASK_ENTRIES | IN_CLOSE_WRITE
+    HEADER = struct.Struct('iIII')
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        import select
+        Watcher.__init__(self)
+        self.ctypes = ctypes
+        self.select = select
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wakeRead, self.wakeWrite = os.pipe()
+        self.descriptors = {}
+        self.dirs = {}
+
+    def Apply(self, dir, subscribers, listing):
+        if not subscribers:
+            with self.watchLock:
+                self.watches.pop(dir, None)
+                wd = self.dirs.pop(dir, None)
+                self.descriptors.pop(wd, None)
+            if wd is not None:
+                self.libc.inotify_rm_watch(self.fd, wd)
+            return
+        contents = any(subscribers.values())
+        mask = self.MASK_CONTENTS if contents else self.MASK_ENTRIES
+        # Adding a watch again on the same inode
+        # returns the same descriptor, new mask.
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir), mask)
+        if wd < 0:
+            errno = self.ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), dir)
+        with self.watchLock:
+            self.watches[dir] = subscribers
+            self.dirs[dir] = wd
+            self.descriptors[wd] = dir
+
+    def Stop(self):
+        Watcher.Stop(self)
+        os.write(self.wakeWrite, b'x')
+
+    def Run(self):
+        try:
+            while not self.stopped.is_set():
+                ready, _, _ = self.select.select([self.fd, self.wakeRead], [], [])
+                if self.fd in ready:
+                    self.Dispatch(os.read(self.fd, 64 * 1024))
+        finally:
+            os.close(self.fd)
+            os.close(self.wakeRead)
+            os.close(self.wakeWrite)
+
+    def Dispatch(self, buffer):
+        offset = 0
+        while offset + self.HEADER.size <= len(buffer):
+            wd, mask, cookie, length = self.HEADER.unpack_from(buffer, offset)
+            offset += self.HEADER.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & self.IN_Q_OVERFLOW:
+                with self.watchLock:
+                    dirs = list(self.watches)
+                for dir in dirs:
+                    self.Notify(dir, RESET, dir)
+                continue
+
+            with self.watchLock:
+                dir = self.descriptors.get(wd)
+            if dir is None:
+                continue
+
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_IGNORED):
+                with self.watchLock:
+                    self.dirs.pop(dir, None)
+                    self.descriptors.pop(wd, None)
+                self.Notify(dir, RESET, dir)
+            elif mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                self.Notify(dir, ADDED, os.path.join(dir, name))
+            elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                self.Notify(dir, DELETED, os.path.join(dir, name))
+            elif mask & (self.IN_CLOSE_WRITE | self.IN_MODIFY):
+                self.Notify(dir, MODIFIED, os.path.join(dir, name))
+
+
+# ====================================================
+# Poll Watcher
+# Every directory is checked with one stat of the
+# directory itself, and listed again when its mtime
+# moves. Files modified in place do not move it: entries
+# of directories whose contents matter are stat'ed only
+# every CONTENTS_INTERVAL, or on Refresh.
+# ====================================================
+class PollWatcher(Watcher):
+    INTERVAL = 1.0
+    CONTENTS_INTERVAL = 60.0
+
+    def __init__(self):
+        Watcher.__init__(self)
+        self.snapshots = {}
+
+    def Apply(self, dir, subscribers, listing):
+        if not subscribers:
+            with self.watchLock:
+                self.watches.pop(dir, None)
+                self.snapshots.pop(dir, None)
+            return
+        contents = any(subscribers.values())
+        with self.watchLock:
+            snapshot = self.snapshots.get(dir)
+        if snapshot is not None and snapshot[1] == contents:
+            pass # Already polled as needed.
+        elif listing is not None and not contents:
+            snapshot = (listing[0], False, dict.fromkeys(listing[1]), time.monotonic())
+        else:
+            snapshot = self.Snapshot(dir, contents)
+        with self.watchLock:
+            self.watches[dir] = subscribers
+            self.snapshots[dir] = snapshot
+
+    def Snapshot(self, dir, contents):
+        mtime = os.stat(dir).st_mtime_ns
+        entries = {}
+        with os.scandir(dir) as it:
+            for e in it:
+                if contents:
+                    try:
+                        stat = e.stat()
+                    except OSError:
+                        continue
+                    entries[e.name] = (stat.st_mtime_ns, stat.st_size)
+                else:
+                    entries[e.name] = None
+        return (mtime, contents, entries, time.monotonic())
+
+    def Refresh(self, dir):
+        with self.watchLock:
+            snapshot = self.snapshots.get(dir)
+        if snapshot is not None:
+            self.Poll(dir, snapshot, True)
+
+    def Run(self):
+        while not self.stopped.wait(self.INTERVAL):
+            with self.watchLock:
+                snapshots = list(self.snapshots.items())
+            now = time.monotonic()
+            for dir, snapshot in snapshots:
+                self.Poll(dir, snapshot, now - snapshot[3] >= self.CONTENTS_INTERVAL)
+
+    def Poll(self, dir, snapshot, full=False):
+        mtime, contents, old, checked = snapshot
+        try:
+            if not (contents and full) and os.stat(dir).st_mtime_ns == mtime:
+                return
+            current = self.Snapshot(dir, contents)
+        except OSError:
+            with self.watchLock:
+                self.snapshots.pop(dir, None)
+            self.Notify(dir, RESET, dir)
+            return
+        with self.watchLock:
+            if self.snapshots.get(dir) is not snapshot:
+                return
+            self.snapshots[dir] = current
+
+        new = current[2]
+        for name in old:
+            if name not in new:
+                self.Notify(dir, DELETED, os.path.join(dir, name))
+        for name, key in new.items():
+            if name not in old:
+                self.Notify(dir, ADDED, os.path.join(dir, name))
+            elif key != old[name]:
+                self.Notify(dir, MODIFIED, os.path.join(dir, name))
+
+
+# ====================================================
+# Self Test
+# Mutates a temporary directory and checks that each
+# expected event arrives, and how fast. Run it with
+# "python watcher.py" or "Project: Watcher self-test".
+# ====================================================
+def SelfTest(watcherClass=None, timeout=5.0):
+    import tempfile
+    if watcherClass is None:
+        watcherClass = type(Watcher.Create())
+    watcher = watcherClass()
+    watcher.Start()
+    received = []
+    condition = threading.Condition()
+
+    def onEvent(event, path):
+        with condition:
+            received.append((event, os.path.basename(path), time.time()))
+            condition.notify_all()
+
+    def expect(event, name, action):
+        with condition:
+            start = len(received)
+        began = time.time()
+        action()
+        deadline = began + timeout
+        with condition:
+            while True:
+                for got, gotName, at in received[start:]:
+                    if got == event and gotName == name:
+                        return (event, name, True, (at - began) * 1000)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return (event, name, False, timeout * 1000)
+                condition.wait(remaining)
+
+    def write(path, text):
+        with open(path, 'w') as file:
+            file.write(text)
+
+    results = []
+    dir = tempfile.mkdtemp(prefix='subl-utils-watch-')
+    try:
+        watcher.Watch(dir, onEvent, contents=True)
+        a = os.path.join(dir, 'a.sublime-project')
+        b = os.path.join(dir, 'b.sublime-project')
+        temp = os.path.join(dir, 'b.tmp')
+        # Keep mtimes apart for coarse filesystem clocks.
+        results.append(expect(ADDED, 'a.sublime-project', lambda: write(a, '{}')))
+        time.sleep(0.05)
+        # In-place writes show up on Refresh when polling.
+        results.append(expect(MODIFIED, 'a.sublime-project', lambda: (write(a, '{"folders": []}'), watcher.Refresh(dir))))
+        write(temp, '{}')
+        results.append(expect(ADDED, 'b.sublime-project', lambda: os.replace(temp, b)))
+        results.append(expect(DELETED, 'a.sublime-project', lambda: os.remove(a)))
+        results.append(expect(ADDED, 'sub', lambda: os.mkdir(os.path.join(dir, 'sub'))))
+    finally:
+        watcher.Stop()
+        for root, dirs, files in os.walk(dir, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            for name in dirs:
+                os.rmdir(os.path.join(root, name))
+        os.rmdir(dir)
+
+    lines = ["Watcher self-test ({0})".format(watcherClass.__name__)]
+    for event, name, ok, ms in results:
+        lines.append("  {0:<4} {1:<7} {2:<20} {3:8.1f} ms".format(
+            'ok' if ok else 'FAIL', event, name, ms))
+    report = '\n'.join(lines)
+    return all(ok for event, name, ok, ms in results), report
+
+
+def plugin_unloaded():
+    Watcher.Shutdown()
+
+
+if __name__ == '__main__':
+    # This package has its own select.py; keep it
+    # from shadowing the standard module.
+    sys.path = [p for p in sys.path if os.path.abspath(p or '.') != os.path.dirname(os.path.abspath(__file__))]
+    classes = [PollWatcher]
+    if sys.platform.startswith('linux'):
+        classes.insert(0, InotifyWatcher)
+    passed = True
+    for watcherClass in classes:
+        ok, report = SelfTest(watcherClass)
+        print(report)
+        passed = passed and ok
+    sys.exit(0 if passed else 1)
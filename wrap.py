@@ -1,5 +1,44 @@
+from .perf import Metrics, timed
+LOAD_START = Metrics.StartLoad()
+
 import sublime
 import sublime_plugin
+import fnmatch
+import math
+import os
+import re
+
+SETTINGS_FILE = 'wrap.sublime-settings'
+KEY_PROFILES = 'wrap_profiles'
+
+
+# ---------------------------------------------------
+# Settings Batch
+# Collects values and writes only those that differ:
+# each write notifies listeners and can re-layout the
+# view. There is no batched write in the API (update()
+# sets one key at a time), so unchanged values are
+# what gets saved.
+# ---------------------------------------------------
+class SettingsBatch(object):
+	def __init__(self, settings):
+		self.settings = settings
+		self.values = {}
+
+	def set(self, key, value):
+		self.values[key] = value
+
+	def commit(self):
+		changed = {}
+		for key, value in self.values.items():
+			if self.settings.get(key) != value:
+				changed[key] = value
+		self.values = {}
+		if len(changed) < 1:
+			return 0
+		for key, value in changed.items():
+			self.settings.set(key, value)
+		return len(changed)
 
 
 class ViewUtil(object):
@@ -18,6 +57,12 @@ class ViewUtil(object):
 
 	def get_wrap_width(self):
 		return self.settings.get("wrap_width")
+
+	def get_tab_size(self):
+		return self.settings.get("tab_size", 4)
+
+	def get_use_tab_stops(self):
+		return self.settings.get("use_tab_stops", True)
 	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 	# Setters 
 	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -30,85 +75,179 @@ class ViewUtil(object):
 	def set_wrap_width(self, value):
 		self.settings.set("wrap_width", value);
 	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-	# Set Wrap Width
+	# Apply Wrap
+	# width: columns, 0 for none or "auto".
+	# Returns the status to show.
 	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-	def setWrap(self, width):
-		rulers = self.get_rulers()
-		word_wrap = self.get_word_wrap()
-		status = "Wrap: N/A"
-
-		if (width > 0): 
-			rulers = [width];
-			word_wrap = True;
-			status = "Wrap: ON";
+	def applyWrap(self, width):
+		batch = SettingsBatch(self.settings)
+		if width == "auto":
+			batch.set("rulers", [])
+			batch.set("word_wrap", True)
+			batch.set("wrap_width", 0)
+			status = "Wrap: Auto"
+		elif (width > 0):
+			batch.set("rulers", [width])
+			batch.set("word_wrap", True)
+			batch.set("wrap_width", width)
+			status = "Wrap: ON"
 		else:
-			rulers = [];
-			word_wrap = False;
+			batch.set("rulers", [])
+			batch.set("word_wrap", False)
+			batch.set("wrap_width", width)
 			status = "Wrap: OFF"
-
-		self.set_rulers(rulers)
-		self.set_word_wrap(word_wrap)
-		self.set_wrap_width(width)
-		sublime.status_message(status)
+		batch.commit()
+		return status
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	# Set Wrap Width
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	def setWrap(self, width):
+		sublime.status_message(self.applyWrap(width))
 	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 	# Set Wrap Auto
 	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 	def setWrapAuto(self):
-		rulers = []
-		word_wrap = True;
-		width = 0;
-		status = "Wrap: Auto"
+		sublime.status_message(self.applyWrap("auto"))
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	# Visual columns
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	# Selections are read in clusters of nearby
+	# lines, one substr per cluster, instead of
+	# one rowcol and one line per selection. A
+	# cluster stops growing at CLUSTER_SIZE, so
+	# one read stays small however many nearby
+	# selections there are.
+	CLUSTER_GAP = 64 * 1024
+	CLUSTER_SIZE = 1024 * 1024
+
+	# spans: sorted (begin, end) pairs.
+	def readClusters(self, spans):
+		clusters = []
+		for span in spans:
+			if (clusters and span[0] - clusters[-1][1] <= self.CLUSTER_GAP
+					and span[1] - clusters[-1][0] <= self.CLUSTER_SIZE):
+				cluster = clusters[-1]
+				if span[1] > cluster[1]:
+					cluster[1] = span[1]
+				cluster[2].append(span)
+			else:
+				clusters.append([span[0], span[1], [span]])
+		for begin, end, members in clusters:
+			span = self.view.line(sublime.Region(begin, end))
+			yield span.begin(), self.view.substr(span), members
+
+	def visualWidth(self, text, tabSize, useTabStops):
+		tabs = text.count("\t")
+		if tabs == 0:
+			return len(text)
+		if useTabStops:
+			return len(text.expandtabs(tabSize))
+		return len(text) + tabs * (tabSize - 1)
+
+	# Widest visual column among the points, as
+	# (column, point); columns count tabs per
+	# tab_size and use_tab_stops.
+	def widestColumn(self, points):
+		tabSize, useTabStops = self.get_tab_size(), self.get_use_tab_stops()
+		widest = (-1, None)
+		for offset, text, members in self.readClusters([(p, p) for p in sorted(points)]):
+			for point, _ in members:
+				local = point - offset
+				lineStart = text.rfind("\n", 0, local) + 1
+				column = self.visualWidth(text[lineStart:local], tabSize, useTabStops)
+				if column > widest[0]:
+					widest = (column, point)
+		return widest
+
+	# Widest line touched by the regions,
+	# as (width, point of its start).
+	def widestLine(self, regions):
+		tabSize, useTabStops = self.get_tab_size(), self.get_use_tab_stops()
+		widest = (-1, None)
+		for offset, text, members in self.readClusters(sorted((r.begin(), r.end()) for r in regions)):
+			for begin, end in members:
+				lineStart = text.rfind("\n", 0, begin - offset) + 1
+				lineEnd = text.find("\n", end - offset)
+				if lineEnd < 0:
+					lineEnd = len(text)
+				for line in text[lineStart:lineEnd].split("\n"):
+					width = self.visualWidth(line, tabSize, useTabStops)
+					if width > widest[0]:
+						widest = (width, offset + lineStart)
+					lineStart += len(line) + 1
+		return widest
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	# Line widths
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	# Small buffers are read whole; larger ones
+	# through evenly spaced blocks, keeping only
+	# the lines that fit entirely in a block. A
+	# block inside one long line counts its
+	# longest piece: the line is at least that.
+	FULL_SCAN_SIZE = 4 * 1024 * 1024
+	SAMPLE_COUNT = 64
+	SAMPLE_SIZE = 64 * 1024
+
+	def sampleLineWidths(self):
+		size = self.view.size()
+		if size <= self.FULL_SCAN_SIZE:
+			blocks = [(0, size)]
+		else:
+			step = size // self.SAMPLE_COUNT
+			blocks = [(i * step, min(size, i * step + self.SAMPLE_SIZE)) for i in range(self.SAMPLE_COUNT)]
+
+		tabSize, useTabStops = self.get_tab_size(), self.get_use_tab_stops()
+		widths = []
+		for begin, end in blocks:
+			pieces = self.view.substr(sublime.Region(begin, end)).split("\n")
+			lines = pieces[(1 if begin > 0 else 0):(len(pieces) - 1 if end < size else len(pieces))]
+			if len(lines) < 1:
+				lines = [max(pieces, key=len)]
+			for line in lines:
+				width = self.visualWidth(line.rstrip("\r"), tabSize, useTabStops)
+				if width > 0:
+					widths.append(width)
+		return widths
 
-		self.set_rulers(rulers)
-		self.set_word_wrap(word_wrap)
-		self.set_wrap_width(width)
-		sublime.status_message(status)
+	# Width that percentile % of the non-empty
+	# lines fit in, or 0 for an empty buffer.
+	def fitWidth(self, percentile):
+		widths = self.sampleLineWidths()
+		if len(widths) < 1:
+			return 0
+		widths.sort()
+		rank = int(math.ceil(len(widths) * min(max(percentile, 0), 100) / 100.0))
+		return widths[min(max(rank, 1), len(widths)) - 1]
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	# Set Wrap Fit Content
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	def setWrapFitContent(self, percentile):
+		width = self.fitWidth(percentile)
+		if width < 1:
+			sublime.status_message("Wrap: no line to fit.")
+			return
+		self.setWrap(width)
 	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 	# Set Wrap At Cursor
 	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 	def setWrapAtCursor(self):
-		print("~~~")
-
-		pointOfHighestCol = None
-		rowOfHighestCol = -1
-		highestCol = -1
-		for s in self.view.sel():
-			(row,col) =  self.view.rowcol(s.end())
-			if col > highestCol:
-				highestCol = col
-				rowOfHighestCol = row
-				pointOfHighestCol = s.end()
-
-		lineRegion = self.view.full_line(pointOfHighestCol)
-		lineContent = self.view.substr(lineRegion)
- 	
-		# Get tab size.
-		settings = self.view.settings()
-		useTabStop = settings.get("use_tab_stops", False)
-		tabSize = settings.get("tab_size", 1)
-
-		# Count totals
-		total = 0
-		nextStop = tabSize
-		for i, char in enumerate(lineContent):
-			if i > (highestCol - 1):
-				break
-
-			if char == "\t":
-				total += nextStop
-			else:
-				total += 1
+		total, point = self.widestColumn([s.end() for s in self.view.sel()])
+		if point is None:
+			return
 
-			if (total % 4) == 0:
-				nextStop = tabSize
-			else:
-				nextStop -= 1
-		
 		# Print infos.
-		print( "Cursor.Y: " + str(rowOfHighestCol) )
+		print( "Cursor.Y: " + str(self.view.rowcol(point)[0]) )
 		print( "Cursor.X: " + str(total) )
 		# Set wrap width
 		self.setWrap(total)
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	# Set Wrap At Widest Line
+	# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+	def setWrapAtWidestLine(self):
+		total, point = self.widestLine(list(self.view.sel()))
+		if point is None:
+			return
+		self.setWrap(total)
 	# --------------
 	# Update Rulers
 	# --------------
@@ -125,13 +264,83 @@ class ViewUtil(object):
 		return;
 
 
+# ---------------------------------------------------
+# Wrap Profiles
+# A width per syntax name ("Markdown") or path glob
+# ("*.csv", "docs/*"), from the wrap_profiles setting;
+# the first matching profile wins. Rules are compiled
+# into a dict and one regex whenever the setting changes.
+# ---------------------------------------------------
+class WrapProfiles(object):
+	syntaxes = {}
+	globRegex = None
+	widths = []
+
+	@classmethod
+	def Load(cls):
+		settings = sublime.load_settings(SETTINGS_FILE)
+		settings.clear_on_change(KEY_PROFILES)
+		settings.add_on_change(KEY_PROFILES, cls.Load)
+		cls.Compile(settings.get(KEY_PROFILES, []))
 
+	@classmethod
+	def Compile(cls, profiles):
+		syntaxes = {}
+		globs = []
+		widths = []
+		for index, profile in enumerate(profiles):
+			widths.append(profile.get("width", 0))
+			if "syntax" in profile:
+				syntaxes.setdefault(profile["syntax"].lower(), index)
+			if "glob" in profile:
+				glob = os.path.normcase(profile["glob"]).replace("\\", "/")
+				if not glob.startswith(("/", "*")) and ":" not in glob:
+					glob = "*/" + glob
+				# Newer Pythons name groups in translated
+				# globs: keep them apart per profile.
+				regex = fnmatch.translate(glob).replace("(?P<", "(?P<p{0}_".format(index)).replace("(?P=", "(?P=p{0}_".format(index))
+				globs.append("(?P<p{0}>{1})".format(index, regex))
+		cls.syntaxes = syntaxes
+		cls.globRegex = re.compile("|".join(globs)) if globs else None
+		cls.widths = widths
+
+	# Width of the first profile matching the
+	# view, or None.
+	@classmethod
+	def Match(cls, view):
+		matches = []
+		syntax = view.settings().get("syntax")
+		if syntax:
+			name = os.path.splitext(os.path.basename(syntax))[0].lower()
+			if name in cls.syntaxes:
+				matches.append(cls.syntaxes[name])
+		path = view.file_name()
+		if path and cls.globRegex is not None:
+			m = cls.globRegex.match(os.path.normcase(path).replace("\\", "/"))
+			if m is not None:
+				matches.append(int(m.lastgroup[1:].split("_")[0]))
+		if len(matches) < 1:
+			return None
+		return cls.widths[min(matches)]
+
+def plugin_loaded():
+	WrapProfiles.Load()
+
+@timed
+class WrapProfileListener(sublime_plugin.EventListener):
+	def on_load(self, view):
+		width = WrapProfiles.Match(view)
+		if width is not None:
+			ViewUtil(view).applyWrap(width)
+
+@timed
 class DisableWrap(sublime_plugin.TextCommand):
 	def run(self, edit):		
 		viewUtil = ViewUtil(self.view);
 		viewUtil.setWrap(0);
 		return;
 
+@timed
 class SetWrap(sublime_plugin.TextCommand):
 	def __init__(self, view):
 		self.view = view;
@@ -141,14 +350,32 @@ class SetWrap(sublime_plugin.TextCommand):
 		viewUtil.setWrap(width);
 		return;
 
+@timed
 class SetWrapAuto(sublime_plugin.TextCommand):
 	def run(self, edit):		
 		viewUtil = ViewUtil(self.view);
 		viewUtil.setWrapAuto();
 		return;
 
+@timed
 class SetWrapAtCursor(sublime_plugin.TextCommand):
 	def run(self, edit):
 		viewUtil = ViewUtil(self.view);
 		viewUtil.setWrapAtCursor();
-		return;
\ No newline at end of file
+		return;
+
+@timed
+class SetWrapAtWidestLine(sublime_plugin.TextCommand):
+	def run(self, edit):
+		viewUtil = ViewUtil(self.view);
+		viewUtil.setWrapAtWidestLine();
+		return;
+
+@timed
+class SetWrapFitContent(sublime_plugin.TextCommand):
+	def run(self, edit, percentile=95):
+		viewUtil = ViewUtil(self.view);
+		viewUtil.setWrapFitContent(percentile);
+		return;
+
+Metrics.StopLoad(__name__, LOAD_START)